@@ -1,9 +1,12 @@
 from django.http import JsonResponse
-from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken
 from django.contrib.auth import get_user_model
 from functools import wraps
 
+from common.principal import get_principal
+from common.tokens import get_token_claims
+from systems.permission.services import has_perm
+
 User = get_user_model()
 
 def auth_required(method='GET'):
@@ -35,10 +38,11 @@ def auth_required(method='GET'):
                 # 提取token
                 token_str = auth_header.split(' ')[1]
                 
-                # 验证token并获取用户信息
-                token = AccessToken(token_str)
-                user_id = token['user_id']
-                user = User.objects.get(id=user_id)
+                # 验证token并获取用户信息（同一令牌只校验一次签名）
+                claims = get_token_claims(token_str)
+                user_id = claims['user_id']
+                # 优先从认证缓存获取用户，避免每次请求都查询数据库
+                user = get_principal(user_id)
                 
                 # 检查用户状态
                 if user.status != 1:
@@ -76,3 +80,22 @@ def auth_required(method='GET'):
                 })
         return wrapper
     return decorator
+
+
+def permission_required(name):
+    """
+    权限校验装饰器，需放在 auth_required 下方使用
+    :param name: 需要的权限名称，如 /authority/user/create
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not has_perm(request.current_user, name):
+                return JsonResponse({
+                    'code': 403,
+                    'message': '没有操作权限',
+                    'data': {}
+                })
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
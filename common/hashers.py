@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    迭代次数由 PASSWORD_PBKDF2_ITERATIONS 配置的 pbkdf2_sha256 哈希器，
+    算法名不变，已有密码仍可校验，迭代次数不一致的密码会在登录成功后重新哈希
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
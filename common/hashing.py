@@ -0,0 +1,182 @@
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+
+from common import metrics
+
+
+class HashPoolBusy(Exception):
+    """
+    密码哈希进程池已满（执行中 + 排队中的任务达到上限）
+    """
+
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+_in_flight = 0
+
+
+def _get_executor():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            config = settings.PASSWORD_HASH_POOL
+            max_workers = config['MAX_WORKERS']
+            if _slots is None:
+                _slots = threading.BoundedSemaphore(max_workers + config['MAX_PENDING'])
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context(config['START_METHOD']),
+            )
+            metrics.gauge('hash_pool.workers', max_workers)
+            metrics.gauge('hash_pool.capacity', max_workers + config['MAX_PENDING'])
+            metrics.gauge('hash_pool.in_flight', 0)
+        return _executor
+
+
+def _discard_executor(executor):
+    global _executor
+    with _lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _update_in_flight(delta):
+    global _in_flight
+    with _lock:
+        _in_flight += delta
+        metrics.gauge('hash_pool.in_flight', _in_flight)
+
+
+def _release(future):
+    _update_in_flight(-1)
+    _slots.release()
+
+
+def _submit(func, *args):
+    """
+    向密码哈希进程池提交任务，池满时立即拒绝而不是排队等待
+
+    :return: (进程池, Future)
+    :raises HashPoolBusy: 执行中和排队中的任务已达上限
+    """
+    executor = _get_executor()
+    if not _slots.acquire(blocking=False):
+        metrics.incr('hash_pool.rejected')
+        raise HashPoolBusy()
+
+    _update_in_flight(1)
+    try:
+        future = executor.submit(func, *args)
+    except Exception:
+        _release(None)
+        raise
+    # 任务真正结束时才归还名额，避免调用方提前返回导致超额提交
+    future.add_done_callback(_release)
+    metrics.incr('hash_pool.submitted')
+    return executor, future
+
+
+def _wait(executor, future):
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        # 子进程异常退出后进程池不可再用，丢弃以便下次重建
+        _discard_executor(executor)
+        raise
+
+
+def run_in_pool(func, *args):
+    """
+    在密码哈希进程池中执行函数并等待结果，池满时立即拒绝而不是排队等待
+
+    :param func: 模块级函数（需可被pickle）
+    :param args: 函数参数
+    :return: 函数返回值
+    :raises HashPoolBusy: 执行中和排队中的任务已达上限
+    """
+    return _wait(*_submit(func, *args))
+
+
+def hash_password(password, salt=None, hasher='default'):
+    """
+    在进程池中执行 make_password
+
+    :raises HashPoolBusy: 进程池已满
+    """
+    return run_in_pool(make_password, password, salt, hasher)
+
+
+def _make_passwords(passwords, hasher):
+    return [make_password(password, None, hasher) for password in passwords]
+
+
+def hash_passwords(passwords, hasher='default', executor=None, chunk_size=16):
+    """
+    批量哈希密码，切分为多个任务并行执行，结果顺序与输入一致
+
+    指定 executor（如管理命令自建的进程池）时按 chunk_size 切分，占满该进程池；
+    未指定时使用共享的密码哈希进程池，每个任务只哈希一个密码，且自身同时最多占用 MAX_WORKERS-1 个任务
+    （至少1个），至少留出一个进程处理登录，登录最多等待一个密码的哈希时间；
+    池满时先等待自身已提交的任务，没有可等待的任务时才拒绝
+
+    :param passwords: 明文密码列表
+    :param hasher: 哈希器
+    :param executor: 独立的进程池，指定时不占用共享进程池
+    :param chunk_size: 使用独立进程池时每个任务哈希的密码个数
+    :return: 密码哈希列表
+    :raises HashPoolBusy: 共享进程池已满且没有自身的任务可等待
+    """
+    if executor is not None:
+        chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+        return [encoded for result in executor.map(_make_passwords, chunks, [hasher] * len(chunks))
+                for encoded in result]
+
+    chunks = [[password] for password in passwords]
+    limit = max(settings.PASSWORD_HASH_POOL['MAX_WORKERS'] - 1, 1)
+    results = []
+    pending = deque()
+    for chunk in chunks:
+        while True:
+            if len(pending) < limit:
+                try:
+                    pending.append(_submit(_make_passwords, chunk, hasher))
+                    break
+                except HashPoolBusy:
+                    if not pending:
+                        raise
+            results.extend(_wait(*pending.popleft()))
+    while pending:
+        results.extend(_wait(*pending.popleft()))
+    return results
+
+
+def verify_password(password, encoded):
+    """
+    在进程池中执行 check_password
+
+    :raises HashPoolBusy: 进程池已满
+    """
+    return run_in_pool(check_password, password, encoded)
+
+
+def password_needs_rehash(encoded):
+    """
+    判断密码哈希是否需要按当前配置（算法、迭代次数、随机盐）重新生成
+
+    :param encoded: 数据库中保存的密码哈希
+    :return: bool
+    """
+    preferred = get_hasher('default')
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return True
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# 进程内计数器，多进程部署时每个worker各自统计
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+# 耗时统计：名称 -> (次数, 总耗时毫秒, 最大耗时毫秒)
+_timings = {}
+
+
+def incr(name, value=1):
+    """
+    计数器累加
+
+    :param name: 计数器名称，如 principal_cache.hit
+    :param value: 累加值
+    """
+    with _lock:
+        _counters[name] += value
+
+
+def gauge(name, value):
+    """
+    设置瞬时值指标（如进程池当前占用数）
+
+    :param name: 指标名称
+    :param value: 当前值
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name, elapsed_ms):
+    """
+    记录一次耗时
+
+    :param name: 指标名称，如 role.save_authorize
+    :param elapsed_ms: 耗时（毫秒）
+    """
+    with _lock:
+        count, total, maximum = _timings.get(name, (0, 0.0, 0.0))
+        _timings[name] = (count + 1, total + elapsed_ms, max(maximum, elapsed_ms))
+
+
+@contextmanager
+def timer(name):
+    """
+    统计代码块耗时的上下文管理器，异常退出时同样记录
+
+    :param name: 指标名称
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - start) * 1000)
+
+
+def snapshot():
+    """
+    获取当前全部计数器、瞬时值和耗时统计的快照，耗时展开为 <名称>.count/.avg_ms/.max_ms
+
+    :return: 字典 {名称: 数值}
+    """
+    with _lock:
+        data = dict(_counters)
+        data.update(_gauges)
+        for name, (count, total, maximum) in _timings.items():
+            data[f'{name}.count'] = count
+            data[f'{name}.avg_ms'] = round(total / count, 3)
+            data[f'{name}.max_ms'] = round(maximum, 3)
+        return data
+
+
+def reset():
+    """
+    清空全部计数器、瞬时值和耗时统计
+    """
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timings.clear()
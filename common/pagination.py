@@ -0,0 +1,87 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class InvalidPagination(ValueError):
+    """
+    分页参数不合法，视图捕获后返回400
+    """
+
+
+class InvalidCursor(InvalidPagination):
+    """
+    分页游标无法解析
+    """
+
+
+def encode_cursor(values):
+    """
+    将排序键的值编码为不透明游标
+
+    :param values: 排序键的值列表
+    :return: URL安全的base64字符串
+    """
+    raw = json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, fields):
+    """
+    解析游标，并按字段类型还原排序键的值
+
+    :param cursor: encode_cursor 生成的游标
+    :param fields: 排序键对应的模型字段列表
+    :return: 排序键的值列表
+    :raises InvalidCursor: 游标格式不正确
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise InvalidCursor('无效的分页游标')
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValueError, TypeError, ValidationError) as e:
+        # 字段的 to_python 对类型不符的值抛出 ValidationError，如整数主键收到字符串
+        raise InvalidCursor('无效的分页游标') from e
+
+
+def keyset_page(queryset, cursor, page_size, keys=('id',)):
+    """
+    游标（keyset）分页：按排序键升序，从游标之后取一页，不使用OFFSET，任意深度的页代价相同
+
+    排序键最后一项须唯一（如主键），如 ('id',) 或 ('created_at', 'id')，且应有对应索引
+
+    :param queryset: 已过滤的查询集
+    :param cursor: 上一页返回的 nextCursor，为空时取第一页
+    :param page_size: 页面大小
+    :param keys: 排序键字段名
+    :return: (当前页对象列表, 下一页游标，没有下一页时为None)
+    :raises InvalidPagination: 页面大小小于1
+    :raises InvalidCursor: 游标格式不正确
+    """
+    # 页面大小为0时无法取末条记录生成游标，负数切片直接报错，在查询前拒绝
+    if page_size < 1:
+        raise InvalidPagination('pageSize 必须大于0')
+
+    fields = [queryset.model._meta.get_field(key) for key in keys]
+    queryset = queryset.order_by(*keys)
+
+    if cursor:
+        values = decode_cursor(cursor, fields)
+        # (k1, k2, ...) > (v1, v2, ...) 展开为 k1>v1 OR (k1=v1 AND k2>v2) OR ...
+        condition = Q()
+        for index, key in enumerate(keys):
+            condition |= Q(**{k: v for k, v in zip(keys[:index], values[:index])}, **{f'{key}__gt': values[index]})
+        queryset = queryset.filter(condition)
+
+    # 多取一条判断是否还有下一页，无需COUNT
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor([field.value_from_object(items[-1]) for field in fields])
+    return items, next_cursor
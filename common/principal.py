@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+
+from common import metrics
+
+# 认证阶段需要的用户字段，其余字段在访问时延迟加载
+PRINCIPAL_FIELDS = ('id', 'username', 'status')
+
+
+def _cache_key(user_id):
+    return f'principal:{user_id}'
+
+
+def get_principal(user_id):
+    """
+    获取认证用户，优先从缓存读取，未命中时查询数据库并写入缓存
+
+    :param user_id: 用户ID
+    :return: 只加载了 PRINCIPAL_FIELDS 的用户实例
+    :raises User.DoesNotExist: 用户不存在
+    """
+    User = get_user_model()
+    key = _cache_key(user_id)
+    values = cache.get(key)
+
+    if values is None:
+        metrics.incr('principal_cache.miss')
+        values = User.objects.filter(id=user_id).values_list(*PRINCIPAL_FIELDS).first()
+        if values is None:
+            raise User.DoesNotExist
+        cache.set(key, values, settings.PRINCIPAL_CACHE_TIMEOUT)
+    else:
+        metrics.incr('principal_cache.hit')
+
+    # 构造延迟加载的实例，save()时也只会更新已加载的字段
+    return User.from_db(User.objects.db, PRINCIPAL_FIELDS, values)
+
+
+def invalidate_principal(user_id):
+    """
+    删除用户的认证缓存
+
+    :param user_id: 用户ID
+    """
+    cache.delete(_cache_key(user_id))
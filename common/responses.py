@@ -100,3 +100,27 @@ def paginate_response(items, page, page_size, total, extra_data=None):
         data.update(extra_data)
         
     return success_response(data=data)
+
+def cursor_paginate_response(items, page_size, next_cursor, total=None, extra_data=None):
+    """
+    游标分页响应，与 paginate_response 并列使用
+
+    :param items: 分页数据项列表
+    :param page_size: 页面大小
+    :param next_cursor: 下一页游标，没有下一页时为None
+    :param total: 总数，未请求统计时为None且不返回
+    :param extra_data: 额外数据
+    :return: JsonResponse
+    """
+    data = {
+        'items': items,
+        'pageSize': page_size,
+        'nextCursor': next_cursor,
+    }
+    if total is not None:
+        data['total'] = total
+    
+    if extra_data:
+        data.update(extra_data)
+        
+    return success_response(data=data)
@@ -0,0 +1,118 @@
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+from django.db.models.functions import Length
+
+# n-gram 长度，短于该长度的关键字无法使用索引，退回 LIKE 查询
+GRAM_SIZE = 3
+
+_BATCH_SIZE = 1000
+
+
+def ngrams(text):
+    """
+    拆分文本为小写的 n-gram 集合
+
+    :param text: 文本
+    :return: n-gram 集合，文本短于 GRAM_SIZE 时为空集合
+    """
+    text = (text or '').lower()
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+def index_texts(gram_model, owner_field, texts):
+    """
+    按集合差异同步对象的 n-gram 索引行：只插入新增的、只删除不再需要的，文本未变化时只有一次查询
+
+    :param gram_model: 索引模型，如 UserSearchGram
+    :param owner_field: 索引模型中指向被索引对象的外键字段名，如 user
+    :param texts: {对象ID: 文本}
+    """
+    if not texts:
+        return
+    desired = {(owner_id, gram) for owner_id, text in texts.items() for gram in ngrams(text)}
+    owner_id_field = f'{owner_field}_id'
+
+    with transaction.atomic():
+        existing = set(
+            gram_model.objects.filter(**{f'{owner_id_field}__in': texts}).values_list(owner_id_field, 'gram')
+        )
+        removed = existing - desired
+        added = desired - existing
+
+        if removed:
+            by_owner = {}
+            for owner_id, gram in removed:
+                by_owner.setdefault(owner_id, []).append(gram)
+            condition = Q()
+            for owner_id, grams in by_owner.items():
+                condition |= Q(**{owner_id_field: owner_id, 'gram__in': grams})
+            gram_model.objects.filter(condition).delete()
+
+        if added:
+            gram_model.objects.bulk_create(
+                [gram_model(**{owner_id_field: owner_id, 'gram': gram}) for owner_id, gram in added],
+                batch_size=_BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+
+
+def rebuild_index(gram_model, owner_field, queryset, field):
+    """
+    全量重建 n-gram 索引表
+
+    :param gram_model: 索引模型
+    :param owner_field: 索引模型中指向被索引对象的外键字段名
+    :param queryset: 被索引对象的查询集（含软删除的记录）
+    :param field: 被索引的文本字段名
+    :return: 写入的行数
+    """
+    owner_id_field = f'{owner_field}_id'
+    total = 0
+    with transaction.atomic():
+        gram_model.objects.all().delete()
+        rows = []
+        for owner_id, text in queryset.values_list('pk', field).iterator(chunk_size=_BATCH_SIZE):
+            rows.extend(gram_model(**{owner_id_field: owner_id, 'gram': gram}) for gram in ngrams(text))
+            if len(rows) >= _BATCH_SIZE:
+                gram_model.objects.bulk_create(rows, ignore_conflicts=True)
+                total += len(rows)
+                rows = []
+        gram_model.objects.bulk_create(rows, ignore_conflicts=True)
+        total += len(rows)
+    return total
+
+
+def search(queryset, field, gram_model, owner_field, keyword):
+    """
+    子串搜索：先用 n-gram 索引筛出包含关键字全部 n-gram 的候选行，再在候选行上用 LIKE 校验；
+    结果按匹配质量排序：完全相同、前缀匹配、其他子串匹配，同级时文本越短越靠前
+
+    关键字短于 GRAM_SIZE 时没有可用的 n-gram，直接使用 LIKE 查询
+
+    :param queryset: 被搜索对象的查询集
+    :param field: 被搜索的文本字段名
+    :param gram_model: 索引模型
+    :param owner_field: 索引模型中指向被索引对象的外键字段名
+    :param keyword: 搜索关键字
+    :return: 过滤并排序后的查询集
+    """
+    grams = ngrams(keyword)
+    if grams:
+        candidates = (
+            gram_model.objects.filter(gram__in=grams)
+            .order_by()
+            .values(owner_field)
+            .annotate(hits=Count('gram'))
+            .filter(hits=len(grams))
+            .values(owner_field)
+        )
+        queryset = queryset.filter(pk__in=candidates)
+
+    return queryset.filter(**{f'{field}__icontains': keyword}).annotate(
+        search_rank=Case(
+            When(**{f'{field}__iexact': keyword}, then=Value(0)),
+            When(**{f'{field}__istartswith': keyword}, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        )
+    ).order_by('search_rank', Length(field), 'pk')
@@ -0,0 +1,29 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_muted_senders = ContextVar('muted_senders', default=frozenset())
+
+
+@contextmanager
+def mute_receivers(*senders):
+    """
+    在上下文中让检查 is_muted 的接收器跳过指定模型的逐行信号，
+    用于批量操作：调用方在操作结束后统一失效缓存或刷新
+
+    :param senders: 模型类
+    """
+    token = _muted_senders.set(_muted_senders.get() | frozenset(senders))
+    try:
+        yield
+    finally:
+        _muted_senders.reset(token)
+
+
+def is_muted(sender):
+    """
+    判断当前上下文是否跳过该模型的逐行信号
+
+    :param sender: 模型类
+    :return: bool
+    """
+    return sender in _muted_senders.get()
@@ -0,0 +1,89 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from common import metrics
+
+
+class LocalTokenBucket:
+    """
+    进程内令牌桶，按最近使用淘汰，桶数量不超过 max_keys
+    """
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def consume(self, key, capacity, refill_rate):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed
+
+
+class CacheTokenBucket:
+    """
+    基于Django缓存的令牌桶，多进程/多机共享；读-改-写不是原子操作，高并发下允许少量误差
+    """
+
+    def consume(self, key, capacity, refill_rate):
+        now = time.time()
+        tokens, updated = cache.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + max(0, now - updated) * refill_rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # 桶回满后即可过期，无需长期占用缓存
+        cache.set(key, (tokens, now), math.ceil(capacity / refill_rate) + 1)
+        return allowed
+
+
+_BACKENDS = {
+    'local': lambda config: LocalTokenBucket(config['MAX_KEYS']),
+    'cache': lambda config: CacheTokenBucket(),
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            config = settings.THROTTLE
+            _backend = _BACKENDS[config['BACKEND']](config)
+        return _backend
+
+
+def allow(scope, ident):
+    """
+    从 scope 对应的令牌桶中取一个令牌，O(1)
+
+    :param scope: 限流规则名称，对应 THROTTLE['RATES'] 中的键，如 login_ip
+    :param ident: 限流对象标识，如IP或用户名
+    :return: 是否放行，拒绝时计入 throttle.<scope>.rejected
+    """
+    rate = settings.THROTTLE['RATES'][scope]
+    digest = hashlib.sha1(str(ident).encode('utf-8')).hexdigest()
+    allowed = _get_backend().consume(
+        f'throttle:{scope}:{digest}',
+        rate['CAPACITY'],
+        rate['REFILL_PER_MINUTE'] / 60,
+    )
+    if not allowed:
+        metrics.incr(f'throttle.{scope}.rejected')
+    return allowed
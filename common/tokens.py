@@ -0,0 +1,58 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from common import metrics
+
+# 已验证令牌的声明缓存：{令牌摘要: (过期时间戳, 声明字典)}，按最近使用排序
+_lock = threading.Lock()
+_claims_cache = OrderedDict()
+
+
+def _digest(token_str):
+    return hashlib.sha256(token_str.encode('utf-8')).hexdigest()
+
+
+def get_token_claims(token_str):
+    """
+    验证访问令牌并返回其声明，同一令牌在当前进程内只做一次签名校验
+
+    :param token_str: 访问令牌字符串
+    :return: 声明字典（副本）
+    :raises TokenError: 令牌无效或已过期
+    """
+    key = _digest(token_str)
+    now = time.time()
+
+    with _lock:
+        entry = _claims_cache.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                _claims_cache.move_to_end(key)
+                metrics.incr('token_cache.hit')
+                return dict(entry[1])
+            # 令牌已过期，移除后重新校验（会抛出过期异常）
+            del _claims_cache[key]
+
+    metrics.incr('token_cache.miss')
+    claims = dict(AccessToken(token_str).payload)
+
+    with _lock:
+        _claims_cache[key] = (claims['exp'], claims)
+        _claims_cache.move_to_end(key)
+        while len(_claims_cache) > settings.TOKEN_CLAIMS_CACHE_SIZE:
+            _claims_cache.popitem(last=False)
+
+    return dict(claims)
+
+
+def clear_token_claims():
+    """
+    清空令牌声明缓存
+    """
+    with _lock:
+        _claims_cache.clear()
@@ -0,0 +1,28 @@
+def build_tree(nodes, project, sort_key=None):
+    """
+    将预先查询好的扁平节点构建为树，线性时间，不递归
+
+    节点需具有 id 与 parent_id 属性（如 values_list(named=True) 的结果或 namedtuple）；
+    先整体排序一次，按排序后的顺序挂载，兄弟节点因此天然有序；
+    父节点不在本次节点集合中的节点作为根节点；没有子节点时不返回 children 字段
+
+    :param nodes: 节点可迭代对象
+    :param project: 将节点转换为返回字典的函数
+    :param sort_key: 排序键函数，为None时保持输入顺序
+    :return: 树形列表
+    """
+    nodes = sorted(nodes, key=sort_key) if sort_key is not None else list(nodes)
+
+    items = {node.id: project(node) for node in nodes}
+
+    tree = []
+    for node in nodes:
+        item = items[node.id]
+        parent = items.get(node.parent_id) if node.parent_id is not None else None
+        if parent is None:
+            tree.append(item)
+        elif 'children' in parent:
+            parent['children'].append(item)
+        else:
+            parent['children'] = [item]
+    return tree
@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+
+
+def _initial_version():
+    # 以毫秒时间戳作为初始值，缓存被清空后重建的版本号不会与旧版本重复
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    """
+    获取版本号，不存在时初始化
+
+    :param name: 版本号名称，如 permission:user:1
+    :return: int
+    """
+    key = f'version:{name}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """
+    版本号加一，使以旧版本号为键的缓存全部失效
+
+    :param name: 版本号名称
+    """
+    key = f'version:{name}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), None)
+
+
+# 进程内的缓存后端，版本号无法在多个进程间共享
+_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """
+    系统检查：默认缓存为进程内后端时给出警告，多进程部署下一个进程中的变更只会使该进程的缓存失效
+
+    单进程部署（如开发环境）可通过 SILENCED_SYSTEM_CHECKS = ['common.W001'] 关闭
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in _LOCAL_CACHE_BACKENDS:
+        return []
+    return [checks.Warning(
+        f'默认缓存后端 {backend} 只在单个进程内有效，版本号无法在进程间共享',
+        hint='多进程（gunicorn/uwsgi 多 worker）或多机部署时请将 CACHES["default"] 配置为 Redis、Memcached 等共享缓存；'
+             '否则权限、认证缓存只在发生变更的进程内失效，菜单快照最长过期 MENU_SNAPSHOT_TTL 秒',
+        id='common.W001',
+    )]
@@ -5,7 +5,8 @@ from common.decorators import auth_required
 from .models import Article
 import json
 from datetime import datetime
-from common.responses import success_response, error_response, model_to_dict, paginate_response
+from common.responses import success_response, error_response, model_to_dict, paginate_response, cursor_paginate_response
+from common.pagination import keyset_page, InvalidPagination
 
 # 文章分页接口
 @csrf_exempt
@@ -29,6 +30,13 @@ def page(request):
         if status:
             articles = articles.filter(status=status)
         
+        # 游标分页：按ID从游标之后取一页，不使用OFFSET，总数仅在 withTotal=true 时统计
+        if 'cursor' in request.GET:
+            total = articles.count() if request.GET.get('withTotal') == 'true' else None
+            paginated_articles, next_cursor = keyset_page(articles, request.GET['cursor'], page_size)
+            article_items = [model_to_dict(article, camel_case=True) for article in paginated_articles]
+            return cursor_paginate_response(article_items, page_size, next_cursor, total)
+
         # 获取总数
         total = articles.count()
         
@@ -42,6 +50,8 @@ def page(request):
             article_items.append(model_to_dict(article, camel_case=True))
         
         return paginate_response(article_items, page, page_size, total, {'totalPage': paginator.num_pages})
+    except InvalidPagination as e:
+        return error_response(str(e), 400)
     except Exception as e:
         return error_response(f'服务器内部错误: {str(e)}')
 
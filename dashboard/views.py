@@ -1,6 +1,7 @@
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 from common.decorators import auth_required
+from common import metrics
 
 '''
 仪表盘统计接口，请根据自身需求进行添加
@@ -12,7 +13,10 @@ def list(request):
         return JsonResponse({
             'code': 200,
             'message': 'success',
-            'data': {}
+            'data': {
+                # 运行指标（缓存命中率等），按worker进程统计
+                'metrics': metrics.snapshot(),
+            }
         })
         
     except Exception as e:
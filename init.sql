@@ -344,5 +344,54 @@ VALUES
     ((SELECT id FROM `role` WHERE name='系统管理员'), (SELECT id FROM `menu` WHERE label='修改文章')),
     ((SELECT id FROM `role` WHERE name='系统管理员'), (SELECT id FROM `menu` WHERE label='删除文章'));
 
+-- 以下为应用维护的派生表，直接导入的数据不会触发信号，需要在这里一并填充
+
+-- 用户有效权限：用户直接权限 + 未删除角色的权限
+INSERT IGNORE INTO user_effective_permission (user_id, permission_id)
+SELECT user_id, permission_id FROM user_permission
+UNION
+SELECT ur.user_id, rp.permission_id FROM user_role ur
+JOIN role_permission rp ON rp.role_id = ur.role_id
+JOIN `role` r ON r.id = ur.role_id
+WHERE r.is_deleted = 0;
+
+-- 菜单闭包表：每对（祖先, 子孙）一行，自身到自身depth为0（需要 MySQL 8.0 的递归CTE，
+-- 低版本请在导入后执行 python manage.py rebuild_menu_closure）
+DELETE FROM menu_closure;
+INSERT INTO menu_closure (ancestor_id, descendant_id, depth)
+WITH RECURSIVE paths (ancestor_id, descendant_id, depth) AS (
+    SELECT id, id, 0 FROM menu
+    UNION ALL
+    SELECT parent.id, paths.descendant_id, paths.depth + 1
+    FROM paths
+    JOIN menu child ON child.id = paths.ancestor_id
+    JOIN menu parent ON parent.id = child.parent_id
+)
+SELECT ancestor_id, descendant_id, depth FROM paths;
+
+-- 用户名、角色名的3字符 n-gram 搜索索引（小写，与 common.search.ngrams 一致；同样需要 MySQL 8.0，
+-- 低版本请在导入后执行 python manage.py rebuild_search_index）
+DELETE FROM user_search_gram;
+INSERT IGNORE INTO user_search_gram (user_id, gram)
+WITH RECURSIVE pos (n) AS (
+    SELECT 1
+    UNION ALL
+    SELECT n + 1 FROM pos WHERE n < 50
+)
+SELECT u.id, LOWER(SUBSTRING(u.username, pos.n, 3))
+FROM `user` u
+JOIN pos ON pos.n <= CHAR_LENGTH(u.username) - 2;
+
+DELETE FROM role_search_gram;
+INSERT IGNORE INTO role_search_gram (role_id, gram)
+WITH RECURSIVE pos (n) AS (
+    SELECT 1
+    UNION ALL
+    SELECT n + 1 FROM pos WHERE n < 50
+)
+SELECT r.id, LOWER(SUBSTRING(r.name, pos.n, 3))
+FROM `role` r
+JOIN pos ON pos.n <= CHAR_LENGTH(r.name) - 2;
+
 -- 提交事务
 COMMIT;
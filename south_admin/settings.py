@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -174,3 +175,69 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_LIFETIME': timedelta(minutes=5),
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
+
+# 缓存配置：缓存失效依赖其中的版本号，多进程/多机部署必须使用共享缓存。
+# 设置环境变量 REDIS_URL（如 redis://127.0.0.1:6379/0，需安装 redis 包）时使用 Redis；
+# 未设置时使用进程内缓存（LocMemCache），版本号只对当前进程可见，只适合单进程开发环境，启动检查会给出警告（common.W001）
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'south-admin',
+        }
+    }
+
+# 进程内菜单快照的最长有效时间（秒），限定共享缓存不可用时其他进程看到旧菜单的时长
+MENU_SNAPSHOT_TTL = 60
+
+# 认证用户缓存时间（秒），用户保存或删除时会主动失效；
+# 进程内缓存下其他进程的缓存无法主动失效，禁用/删除用户最迟在该时间后生效，因此缩短
+PRINCIPAL_CACHE_TIMEOUT = 300 if REDIS_URL else 30
+
+# 已验证令牌声明的缓存条数上限（每个worker进程），条目在令牌过期时失效
+TOKEN_CLAIMS_CACHE_SIZE = 10000
+
+# 登录密码哈希进程池：进程数、最大排队数（超出时直接返回繁忙）和进程启动方式
+PASSWORD_HASH_POOL = {
+    'MAX_WORKERS': 2,
+    'MAX_PENDING': 8,
+    'START_METHOD': 'spawn',
+}
+
+# 用户导入接口单次最多导入的行数，导入在请求内哈希密码且与登录共用进程池，大批量请使用 manage.py import_users
+USER_IMPORT_MAX_ROWS = 100
+
+# 密码哈希器与 PBKDF2 迭代次数，迭代次数调整后旧密码会在下次登录时自动重新哈希
+PASSWORD_HASHERS = [
+    'common.hashers.ConfigurablePBKDF2PasswordHasher',
+]
+PASSWORD_PBKDF2_ITERATIONS = 1000000
+
+# 令牌桶限流：BACKEND 为 local（进程内）或 cache（使用 CACHES 共享）
+# CAPACITY 为突发上限，REFILL_PER_MINUTE 为每分钟恢复的令牌数
+THROTTLE = {
+    'BACKEND': 'local',
+    'MAX_KEYS': 100000,
+    'RATES': {
+        'login_ip': {'CAPACITY': 20, 'REFILL_PER_MINUTE': 10},
+        'login_username': {'CAPACITY': 5, 'REFILL_PER_MINUTE': 5},
+    },
+}
+
+# 用户有效权限/角色缓存时间（秒），相关数据变更时通过版本号失效；
+# 进程内缓存下其他进程无法收到版本号变更，缩短以限定过期时间
+PERMISSION_CACHE_TIMEOUT = 3600 if REDIS_URL else 60
+
+# 进程内权限位序号映射、角色位图的最长有效时间（秒），限定共享缓存不可用时其他进程看到旧权限的时长
+PERMISSION_LOCAL_TTL = 60
+
+# 刷新权限接口只在访问令牌剩余有效期小于该值时重新签发令牌
+TOKEN_REISSUE_BEFORE = timedelta(hours=2)
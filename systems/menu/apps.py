@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class MenuConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'systems.menu'
+
+    def ready(self):
+        # 注册信号处理函数
+        from . import signals  # noqa: F401
+
+        # 检查缓存失效所依赖的版本号是否在进程间共享
+        from django.core import checks
+        from common.versioning import check_shared_cache
+        checks.register(check_shared_cache, checks.Tags.caches)
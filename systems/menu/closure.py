@@ -0,0 +1,141 @@
+from django.db import transaction
+
+from systems.menu.models import Menu, MenuClosure, MenuClosureMissing
+
+
+def insert_node(menu_id, parent_id):
+    """
+    新建菜单时写入闭包行：自身一行，加上父菜单全部祖先到新菜单的行
+
+    :param menu_id: 新菜单ID
+    :param parent_id: 父菜单ID，根菜单为None
+    """
+    rows = [MenuClosure(ancestor_id=menu_id, descendant_id=menu_id, depth=0)]
+    if parent_id is not None:
+        links = MenuClosure.objects.filter(descendant_id=parent_id).values_list('ancestor_id', 'depth')
+        rows.extend(
+            MenuClosure(ancestor_id=ancestor_id, descendant_id=menu_id, depth=depth + 1)
+            for ancestor_id, depth in links
+        )
+    MenuClosure.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def insert_nodes(nodes):
+    """
+    批量写入新建菜单的闭包行，用于 bulk_create 创建的菜单（不触发信号）；
+    已有父菜单的祖先一次查出，新菜单之间的层级在内存中推导
+
+    :param nodes: [(菜单ID, 父菜单ID)]，父菜单也是新菜单时须排在其后
+    """
+    new_ids = {menu_id for menu_id, _ in nodes}
+    existing_parents = {parent_id for _, parent_id in nodes if parent_id is not None and parent_id not in new_ids}
+    ancestors = {}
+    for ancestor_id, descendant_id, depth in MenuClosure.objects.filter(
+        descendant_id__in=existing_parents
+    ).values_list('ancestor_id', 'descendant_id', 'depth'):
+        ancestors.setdefault(descendant_id, []).append((ancestor_id, depth))
+
+    rows = []
+    for menu_id, parent_id in nodes:
+        links = [(menu_id, 0)]
+        if parent_id is not None:
+            links.extend((ancestor_id, depth + 1) for ancestor_id, depth in ancestors.get(parent_id, ()))
+        ancestors[menu_id] = links
+        rows.extend(
+            MenuClosure(ancestor_id=ancestor_id, descendant_id=menu_id, depth=depth)
+            for ancestor_id, depth in links
+        )
+    MenuClosure.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+def detach_subtree(menu_id):
+    """
+    断开子树与外部祖先的闭包行，子树内部的行保持不变
+
+    :param menu_id: 子树根菜单ID
+    :return: 子树内 {菜单ID: 相对子树根的深度}
+    """
+    subtree = dict(MenuClosure.objects.filter(ancestor_id=menu_id).values_list('descendant_id', 'depth'))
+    MenuClosure.objects.filter(descendant_id__in=list(subtree)).exclude(ancestor_id__in=list(subtree)).delete()
+    return subtree
+
+
+def move_subtree(menu_id, parent_id):
+    """
+    菜单更换父菜单时整体移动子树的闭包行
+
+    :param menu_id: 被移动的菜单ID
+    :param parent_id: 新父菜单ID，移动到根级时为None
+    """
+    with transaction.atomic():
+        subtree = detach_subtree(menu_id)
+        if parent_id is None:
+            return
+        links = MenuClosure.objects.filter(descendant_id=parent_id).values_list('ancestor_id', 'depth')
+        MenuClosure.objects.bulk_create(
+            [
+                MenuClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth + sub_depth + 1)
+                for ancestor_id, depth in links
+                for descendant_id, sub_depth in subtree.items()
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+def detach_children(menu_id):
+    """
+    硬删除菜单前调用：子菜单的外键会被置空成为根菜单，先断开它们子树与外部祖先的闭包行，
+    被删除菜单自身的闭包行随外键级联删除
+
+    :param menu_id: 将被删除的菜单ID
+    """
+    ancestors = list(
+        MenuClosure.objects.filter(descendant_id=menu_id).values_list('ancestor_id', flat=True)
+    )
+    descendants = list(
+        MenuClosure.objects.filter(ancestor_id=menu_id, depth__gt=0).values_list('descendant_id', flat=True)
+    )
+    if descendants:
+        MenuClosure.objects.filter(ancestor_id__in=ancestors, descendant_id__in=descendants).delete()
+
+
+def is_descendant(menu_id, ancestor_id):
+    """
+    判断 menu_id 是否为 ancestor_id 自身或其子孙，用于防止移动菜单形成环
+
+    :param menu_id: 菜单ID
+    :param ancestor_id: 祖先菜单ID
+    :return: bool
+    :raises MenuClosureMissing: menu_id 在闭包表中没有数据，无法判断
+    """
+    ancestors = set(
+        MenuClosure.objects.filter(descendant_id=menu_id, ancestor_id__in={menu_id, ancestor_id})
+        .values_list('ancestor_id', flat=True)
+    )
+    if menu_id not in ancestors:
+        raise MenuClosureMissing([menu_id])
+    return ancestor_id in ancestors
+
+
+def rebuild():
+    """
+    根据菜单的父级关系全量重建闭包表（含软删除菜单）
+
+    :return: 写入的行数
+    """
+    parents = dict(Menu.objects_with_deleted.values_list('id', 'parent_id'))
+    rows = []
+    for menu_id in parents:
+        depth = 0
+        node_id = menu_id
+        seen = set()
+        while node_id is not None and node_id in parents and node_id not in seen:
+            seen.add(node_id)
+            rows.append(MenuClosure(ancestor_id=node_id, descendant_id=menu_id, depth=depth))
+            node_id = parents[node_id]
+            depth += 1
+    with transaction.atomic():
+        MenuClosure.objects.all().delete()
+        MenuClosure.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
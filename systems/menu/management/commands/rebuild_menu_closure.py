@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from systems.menu import closure
+
+
+class Command(BaseCommand):
+    help = '根据菜单父级关系全量重建菜单闭包表（menu_closure）'
+
+    def handle(self, *args, **options):
+        rows = closure.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'重建完成：写入 {rows} 行'))
@@ -0,0 +1,46 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_closure(apps, schema_editor):
+    Menu = apps.get_model('menu', 'Menu')
+    MenuClosure = apps.get_model('menu', 'MenuClosure')
+    parents = dict(Menu.objects.values_list('id', 'parent_id'))
+    rows = []
+    for menu_id in parents:
+        depth = 0
+        node_id = menu_id
+        seen = set()
+        while node_id is not None and node_id in parents and node_id not in seen:
+            seen.add(node_id)
+            rows.append(MenuClosure(ancestor_id=node_id, descendant_id=menu_id, depth=depth))
+            node_id = parents[node_id]
+            depth += 1
+    MenuClosure.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MenuClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.IntegerField(default=0, verbose_name='层级差')),
+                ('ancestor', models.ForeignKey(db_column='ancestor_id', on_delete=django.db.models.deletion.CASCADE, related_name='closure_descendants', to='menu.menu', verbose_name='祖先菜单')),
+                ('descendant', models.ForeignKey(db_column='descendant_id', on_delete=django.db.models.deletion.CASCADE, related_name='closure_ancestors', to='menu.menu', verbose_name='子孙菜单')),
+            ],
+            options={
+                'verbose_name': '菜单闭包',
+                'verbose_name_plural': '菜单闭包管理',
+                'db_table': 'menu_closure',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='menu_closure_desc_depth_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(backfill_closure, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,112 @@
 from django.db import models
 from django.utils import timezone
+from common.tree import build_tree
+from systems.menu.trees import fetch_menu_nodes, tree_node, by_order
 from systems.permission.models import Permission
 
+
+class MenuClosureMissing(Exception):
+    """
+    菜单在闭包表中没有数据（如绕过应用直接写入了菜单），基于闭包表的查询结果不可信，
+    需要执行 python manage.py rebuild_menu_closure 重建
+    """
+
+    def __init__(self, menu_ids):
+        self.menu_ids = sorted(menu_ids)
+        super().__init__(
+            f"菜单闭包表缺少菜单 {', '.join(str(menu_id) for menu_id in self.menu_ids)} 的数据，"
+            f"请执行 python manage.py rebuild_menu_closure 重建"
+        )
+
+
+class MenuManager(models.Manager):
+    """
+    菜单管理器，基于闭包表批量查询祖先/子孙菜单及构建菜单树
+    """
+
+    def ancestors_of(self, menu_ids):
+        """
+        获取一组菜单的全部祖先菜单（不含自身），一次查询
+        """
+        return self.filter(
+            closure_descendants__descendant_id__in=menu_ids,
+            closure_descendants__depth__gt=0,
+        ).distinct()
+
+    def descendants_of(self, menu_ids):
+        """
+        获取一组菜单的全部子孙菜单（不含自身），一次查询
+        """
+        return self.filter(
+            closure_ancestors__ancestor_id__in=menu_ids,
+            closure_ancestors__depth__gt=0,
+        ).distinct()
+
+    def delete_subtree(self, menu_id):
+        """
+        软删除菜单及其全部子孙菜单，一条 UPDATE 语句；update不触发信号，调用方负责使菜单快照失效
+
+        :param menu_id: 子树根菜单ID
+        :return: 本次删除的菜单数
+        """
+        now = timezone.now()
+        subtree = MenuClosure.objects.filter(ancestor_id=menu_id).values('descendant_id')
+        return self.filter(id__in=subtree, is_deleted=0).update(is_deleted=1, deleted_at=now, updated_at=now)
+
+    def restore_subtree(self, menu):
+        """
+        恢复菜单及与它一同被级联删除（删除时间相同）的子孙菜单，一条 UPDATE 语句；
+        在此之前单独删除的子孙菜单保持删除状态
+
+        :param menu: 已软删除的子树根菜单
+        :return: 本次恢复的菜单数
+        """
+        subtree = MenuClosure.objects.filter(ancestor_id=menu.id).values('descendant_id')
+        return self.filter(id__in=subtree, is_deleted=1, deleted_at=menu.deleted_at).update(
+            is_deleted=0, deleted_at=None, updated_at=timezone.now()
+        )
+
+    def tree(self, root_ids=None):
+        """
+        批量构建菜单树（to_tree_dict格式），无论树多大都只查询一次
+
+        与 to_tree_dict 一致：根菜单本身总是返回，其下只包含state为1的子菜单，隐藏菜单的子树整体跳过；
+        多个根菜单互为祖孙时，后者挂在前者的树中返回
+
+        :param root_ids: 根菜单ID集合，为None时返回全部顶级菜单的树
+        :return: 树形列表，根菜单按order排序
+        :raises MenuClosureMissing: 存在的根菜单在闭包表中没有数据
+        """
+        if root_ids is None:
+            nodes = fetch_menu_nodes(self.all())
+            roots = {node.id for node in nodes if node.parent_id is None}
+        else:
+            roots = set(root_ids)
+            nodes = fetch_menu_nodes(self.filter(closure_ancestors__ancestor_id__in=roots).distinct())
+            # 根菜单自身的闭包行（depth为0）缺失时子树无法查出，不返回残缺的树
+            missing = roots - {node.id for node in nodes}
+            if missing:
+                missing = set(self.filter(id__in=missing).values_list('id', flat=True))
+                if missing:
+                    raise MenuClosureMissing(missing)
+
+        children = {}
+        for node in nodes:
+            if node.state == 1:
+                children.setdefault(node.parent_id, []).append(node)
+
+        # 从根菜单出发只沿显示中的子菜单向下，不可达的节点不返回
+        reachable = [node for node in nodes if node.id in roots]
+        index = 0
+        while index < len(reachable):
+            for child in children.get(reachable[index].id, ()):
+                if child.id not in roots:
+                    reachable.append(child)
+            index += 1
+
+        return build_tree(reachable, tree_node, by_order)
+
+
 class Menu(models.Model):
     label = models.CharField(max_length=50, verbose_name='菜单名称')
     label_en = models.CharField(max_length=50, verbose_name='英文名称')
@@ -23,7 +128,7 @@ class Menu(models.Model):
     deleted_at = models.DateTimeField(null=True, blank=True, verbose_name='删除时间')
     
     # 添加默认管理器，只返回未被软删除的记录
-    objects = models.Manager()
+    objects = MenuManager()
     
     # 添加一个自定义管理器，用于包含被软删除的记录
     objects_with_deleted = models.Manager()
@@ -36,7 +141,7 @@ class Menu(models.Model):
     def delete(self):
         self.is_deleted = 1
         self.deleted_at = timezone.now()
-        self.save()
+        self.save(update_fields=['is_deleted', 'deleted_at', 'updated_at'])
     
     # 真实删除方法
     def hard_delete(self, using=None, keep_parents=False):
@@ -46,7 +151,7 @@ class Menu(models.Model):
     def restore(self):
         self.is_deleted = 0
         self.deleted_at = None
-        self.save()
+        self.save(update_fields=['is_deleted', 'deleted_at', 'updated_at'])
     
     class Meta:
         db_table = 'menu'
@@ -65,23 +170,27 @@ class Menu(models.Model):
 
     def get_descendants(self):
         """
-        获取所有子孙菜单
-        """
-        descendants = []
-        for child in self.get_children():
-            descendants.append(child)
-            descendants.extend(child.get_descendants())
-        return descendants
+        获取所有子孙菜单（跳过隐藏菜单及其子树）
+        """
+        # 自身以下被隐藏的菜单，它们的子树整体排除
+        hidden = MenuClosure.objects.filter(
+            ancestor_id=self.id, depth__gt=0, descendant__state=0
+        ).values('descendant_id')
+        hidden_subtrees = MenuClosure.objects.filter(ancestor_id__in=hidden).values('descendant_id')
+        return list(
+            Menu.objects.filter(closure_ancestors__ancestor_id=self.id, closure_ancestors__depth__gt=0)
+            .exclude(id__in=hidden_subtrees)
+            .order_by('closure_ancestors__depth', 'order')
+        )
 
     def get_ancestors(self):
         """
-        获取所有祖先菜单
+        获取所有祖先菜单（由近及远）
         """
-        ancestors = []
-        if self.parent:
-            ancestors.append(self.parent)
-            ancestors.extend(self.parent.get_ancestors())
-        return ancestors
+        return list(
+            Menu.objects.filter(closure_descendants__descendant_id=self.id, closure_descendants__depth__gt=0)
+            .order_by('closure_descendants__depth')
+        )
 
     def is_root(self):
         """
@@ -99,40 +208,41 @@ class Menu(models.Model):
         """
         获取菜单层级（根节点为0级）
         """
-        level = 0
-        current = self
-        while current.parent:
-            level += 1
-            current = current.parent
-        return level
+        level = MenuClosure.objects.filter(descendant_id=self.id).aggregate(level=models.Max('depth'))['level']
+        return level or 0
 
     def get_full_path(self):
         """
         获取从根节点到当前节点的完整路径
         """
-        path = []
-        current = self
-        while current:
-            path.insert(0, current)
-            current = current.parent
+        path = self.get_ancestors()
+        path.reverse()
+        path.append(self)
         return path
 
     def to_tree_dict(self):
         """
-        将菜单转换为树形字典结构
-        """
-        children_data = [child.to_tree_dict() for child in self.get_children()]
-        data = {
-            'id': self.id,
-            'label': self.label,
-            'labelEn': self.label_en,
-            'icon': self.icon,
-            'router': self.router,
-            'rule': self.permission.name if self.permission else None,
-            'type': self.type,
-            'order': self.order,
-            'state': self.state,
-            'parentId': self.parent_id,
-            'children': children_data if children_data else []
-        }
-        return data
+        将菜单转换为树形字典结构，整棵子树一次查询
+        """
+        return Menu.objects.tree([self.id])[0]
+
+
+# 菜单闭包表：每对（祖先, 子孙）一行，depth为层级差，自身到自身depth为0
+class MenuClosure(models.Model):
+    ancestor = models.ForeignKey(Menu, on_delete=models.CASCADE, related_name='closure_descendants',
+                                 verbose_name='祖先菜单', db_column='ancestor_id')
+    descendant = models.ForeignKey(Menu, on_delete=models.CASCADE, related_name='closure_ancestors',
+                                   verbose_name='子孙菜单', db_column='descendant_id')
+    depth = models.IntegerField(default=0, verbose_name='层级差')
+
+    class Meta:
+        db_table = 'menu_closure'
+        verbose_name = '菜单闭包'
+        verbose_name_plural = '菜单闭包管理'
+        unique_together = (('ancestor', 'descendant'),)
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='menu_closure_desc_depth_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} - {self.descendant_id} ({self.depth})"
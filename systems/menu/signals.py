@@ -0,0 +1,50 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from common.signals import is_muted
+from systems.menu import closure
+from systems.menu.models import Menu
+from systems.menu.snapshot import invalidate_menu_snapshot
+from systems.permission.models import Permission
+from systems.role.models import RoleMenu
+
+
+# 菜单、角色菜单关联变更，或权限改名（菜单的rule）时使菜单快照失效
+@receiver(post_save, sender=Menu)
+@receiver(post_delete, sender=Menu)
+@receiver(post_save, sender=RoleMenu)
+@receiver(post_delete, sender=RoleMenu)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidate_menu(sender, **kwargs):
+    if is_muted(sender):
+        return
+    invalidate_menu_snapshot()
+
+
+# 记录保存前的父菜单，用于判断是否需要移动闭包表中的子树
+@receiver(pre_save, sender=Menu)
+def remember_parent(sender, instance, **kwargs):
+    if instance._state.adding or instance.pk is None:
+        instance._closure_parent_id = None
+        return
+    instance._closure_parent_id = (
+        Menu.objects_with_deleted.filter(pk=instance.pk).values_list('parent_id', flat=True).first()
+    )
+
+
+# 新建菜单写入闭包行，更换父菜单时移动整棵子树
+@receiver(post_save, sender=Menu)
+def maintain_closure(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        closure.insert_node(instance.id, instance.parent_id)
+    elif instance.parent_id != getattr(instance, '_closure_parent_id', instance.parent_id):
+        closure.move_subtree(instance.id, instance.parent_id)
+
+
+# 硬删除菜单时子菜单成为根菜单，先断开它们与外部祖先的闭包行
+@receiver(pre_delete, sender=Menu)
+def detach_closure(sender, instance, **kwargs):
+    closure.detach_children(instance.id)
@@ -0,0 +1,117 @@
+import threading
+import time
+from types import MappingProxyType
+
+from django.conf import settings
+
+from common.versioning import get_version, bump_version
+from systems.menu.models import Menu
+from systems.menu.trees import fetch_menu_nodes, build_admin_tree
+from systems.role.models import RoleMenu
+
+# 菜单表或角色菜单关联变更时递增
+MENU_VERSION = 'menu'
+
+
+class MenuSnapshot:
+    """
+    全部未删除菜单及角色菜单关联的只读快照，进程内共享，不可修改
+    """
+
+    def __init__(self, nodes, role_menus):
+        self.nodes = MappingProxyType(nodes)
+        self.role_menus = MappingProxyType(role_menus)
+
+    def menu_ids_for_roles(self, role_ids):
+        """
+        获取多个角色关联的菜单ID并集
+        """
+        menu_ids = set()
+        for role_id in role_ids:
+            menu_ids.update(self.role_menus.get(role_id, ()))
+        return menu_ids
+
+    def ancestors(self, menu_id):
+        """
+        沿父级链向上获取祖先节点（不含自身）
+        """
+        result = []
+        node = self.nodes.get(menu_id)
+        while node is not None and node.parent_id is not None:
+            node = self.nodes.get(node.parent_id)
+            if node is not None:
+                result.append(node)
+        return result
+
+
+_lock = threading.Lock()
+_snapshot = (None, 0, None)
+
+
+def _load():
+    nodes = {node.id: node for node in fetch_menu_nodes(Menu.objects.filter(is_deleted=0))}
+
+    role_menus = {}
+    for role_id, menu_id in RoleMenu.objects.values_list('role_id', 'menu_id'):
+        role_menus.setdefault(role_id, set()).add(menu_id)
+    role_menus = {role_id: frozenset(menu_ids) for role_id, menu_ids in role_menus.items()}
+
+    return MenuSnapshot(nodes, role_menus)
+
+
+def get_menu_snapshot():
+    """
+    获取当前菜单快照，版本号变化或超过 MENU_SNAPSHOT_TTL 秒时重新加载
+
+    版本号只在共享缓存后端中对所有进程可见；使用进程内缓存（LocMemCache）时，
+    其他进程的变更无法通知到本进程，由 TTL 限定快照最长的过期时间
+
+    :return: MenuSnapshot
+    """
+    global _snapshot
+    version = get_version(MENU_VERSION)
+    if _snapshot[0] != version or time.monotonic() - _snapshot[1] > settings.MENU_SNAPSHOT_TTL:
+        with _lock:
+            if _snapshot[0] != version or time.monotonic() - _snapshot[1] > settings.MENU_SNAPSHOT_TTL:
+                _snapshot = (version, time.monotonic(), _load())
+    return _snapshot[2]
+
+
+def invalidate_menu_snapshot():
+    """
+    使菜单快照失效：共享缓存后端下所有进程在下次读取时重新加载；
+    进程内缓存（LocMemCache）下只有当前进程立即生效，其他进程最迟 MENU_SNAPSHOT_TTL 秒后重新加载
+    """
+    bump_version(MENU_VERSION)
+
+
+def build_user_menu_tree(role_ids):
+    """
+    根据角色从快照中裁剪出用户可见的菜单树（不含按钮），不查询数据库
+
+    :param role_ids: 用户的角色ID列表
+    :return: 菜单树列表
+    """
+    snapshot = get_menu_snapshot()
+    nodes = snapshot.nodes
+
+    # 角色直接关联的菜单，加上它们显示中的祖先菜单
+    visible = set()
+    for menu_id in snapshot.menu_ids_for_roles(role_ids):
+        node = nodes.get(menu_id)
+        if node is None or node.type >= 3:
+            continue
+        visible.add(menu_id)
+        for ancestor in snapshot.ancestors(menu_id):
+            if ancestor.state == 1 and ancestor.type < 3:
+                visible.add(ancestor.id)
+
+    # 过滤掉state为0的节点（以及挂在它们下面的子节点）
+    def is_shown(node):
+        while node is not None:
+            if node.state != 1:
+                return False
+            node = nodes[node.parent_id] if node.parent_id in visible else None
+        return True
+
+    return build_admin_tree(nodes[menu_id] for menu_id in visible if is_shown(nodes[menu_id]))
@@ -1,3 +1,103 @@
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework_simplejwt.tokens import RefreshToken
 
-# Create your tests here.
+from systems.menu.models import Menu
+from systems.permission.models import Permission
+from systems.user.models import User
+
+
+class MenuTreeQueryCountTests(TestCase):
+    """
+    菜单树构建的查询次数不随菜单数量增长
+    """
+
+    def create_tree(self, width, depth, parent=None, prefix='m'):
+        for index in range(width):
+            label = f'{prefix}-{index}'
+            permission = Permission.objects.create(name=f'/{label}')
+            menu = Menu.objects.create(label=label, type=1, parent=parent, permission=permission, order=index)
+            if depth > 1:
+                self.create_tree(width, depth - 1, menu, label)
+
+    def count_nodes(self, items):
+        return sum(1 + self.count_nodes(item['children']) for item in items)
+
+    def test_to_tree_dict_uses_one_query(self):
+        for width in (2, 4):
+            self.create_tree(width, 3, prefix=f'w{width}')
+            root = Menu.objects.get(label=f'w{width}-0')
+            with self.assertNumQueries(1):
+                data = root.to_tree_dict()
+            self.assertEqual(self.count_nodes([data]), 1 + width + width * width)
+            self.assertEqual(data['rule'], f'/{root.label}')
+
+    def test_manager_tree_uses_one_query(self):
+        self.create_tree(3, 3)
+        root_ids = list(Menu.objects.filter(parent=None).values_list('id', flat=True))
+        with self.assertNumQueries(1):
+            tree = Menu.objects.tree(root_ids)
+        self.assertEqual([item['order'] for item in tree], [0, 1, 2])
+        self.assertEqual(self.count_nodes(tree), 3 + 9 + 27)
+        with self.assertNumQueries(1):
+            self.assertEqual(Menu.objects.tree(), tree)
+
+    def test_hidden_subtree_is_skipped(self):
+        self.create_tree(2, 3)
+        root = Menu.objects.get(label='m-0')
+        Menu.objects.filter(label='m-0-1').update(state=0)
+        data = root.to_tree_dict()
+        self.assertEqual([child['label'] for child in data['children']], ['m-0-0'])
+        self.assertEqual(self.count_nodes([data]), 4)
+
+
+class MenuSubtreeDeleteRestoreTests(TestCase):
+    """
+    级联软删除/恢复整棵子树；恢复时只恢复与根菜单一同被删除的子孙菜单
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='admin', password='!', status=1)
+        cls.root = Menu.objects.create(label='root', type=1)
+        cls.child = Menu.objects.create(label='child', type=2, parent=cls.root)
+        cls.grandchild = Menu.objects.create(label='grandchild', type=3, parent=cls.child)
+        cls.sibling = Menu.objects.create(label='sibling', type=2, parent=cls.root)
+        cls.other = Menu.objects.create(label='other', type=1)
+
+    def setUp(self):
+        cache.clear()
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def deleted_labels(self):
+        return set(Menu.objects_with_deleted.filter(is_deleted=1).values_list('label', flat=True))
+
+    def test_delete_without_cascade_rejects_parent(self):
+        response = self.client.delete(f'/system/menu/{self.root.id}', **self.auth).json()
+        self.assertEqual(response['code'], 400)
+        self.assertEqual(self.deleted_labels(), set())
+
+    def test_cascade_delete_and_restore(self):
+        # 先单独删除一个子菜单，它不属于之后级联删除的那一批
+        self.client.delete(f'/system/menu/{self.sibling.id}', **self.auth)
+
+        response = self.client.delete(f'/system/menu/{self.root.id}?cascade=true', **self.auth).json()
+        self.assertEqual(response['code'], 200, response)
+        self.assertEqual(response['data']['count'], 3)
+        self.assertEqual(self.deleted_labels(), {'root', 'child', 'grandchild', 'sibling'})
+        deleted_at = set(
+            Menu.objects_with_deleted.filter(label__in=['root', 'child', 'grandchild'])
+            .values_list('deleted_at', flat=True)
+        )
+        self.assertEqual(len(deleted_at), 1)
+
+        response = self.client.put(f'/system/menu/restore/{self.root.id}?cascade=true', **self.auth).json()
+        self.assertEqual(response['code'], 200, response)
+        self.assertEqual(response['data']['count'], 3)
+        self.assertEqual(self.deleted_labels(), {'sibling'})
+        self.assertFalse(Menu.objects_with_deleted.filter(label='root', deleted_at__isnull=False).exists())
+
+    def test_restore_rejects_live_menu(self):
+        response = self.client.put(f'/system/menu/restore/{self.other.id}', **self.auth).json()
+        self.assertEqual(response['code'], 400)
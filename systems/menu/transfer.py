@@ -0,0 +1,285 @@
+import json
+
+from django.db import transaction
+from django.utils import timezone
+
+from common.tree import build_tree
+from systems.menu import closure
+from systems.menu.models import Menu
+from systems.menu.snapshot import invalidate_menu_snapshot
+from systems.menu.trees import by_order
+from systems.permission import services as permission_services
+from systems.permission.models import Permission
+from systems.role.models import RoleMenu
+
+# 导入导出文档中的菜单字段：文档字段名 -> 模型字段名
+_FIELDS = {
+    'labelEn': 'label_en',
+    'icon': 'icon',
+    'router': 'router',
+    'type': 'type',
+    'order': 'order',
+    'state': 'state',
+}
+
+_BATCH_SIZE = 500
+
+
+def _export_node(node):
+    return {
+        'label': node.label,
+        'labelEn': node.label_en,
+        'icon': node.icon,
+        'router': node.router,
+        'rule': node.permission__name,
+        'ruleDescription': node.permission__description,
+        'type': node.type,
+        'order': node.order,
+        'state': node.state,
+    }
+
+
+def export_tree():
+    """
+    一次查询读取全部未删除菜单（含隐藏菜单）的树及其权限
+
+    :return: 导出格式的菜单树列表
+    """
+    rows = Menu.objects.filter(is_deleted=0).values_list(
+        'id', 'parent_id', 'label', 'label_en', 'icon', 'router', 'permission__name',
+        'permission__description', 'type', 'order', 'state', named=True,
+    )
+    return build_tree(rows, _export_node, by_order)
+
+
+def iter_export_json(tree):
+    """
+    以JSON分块流式输出菜单树，只做序列化不查询数据库；
+    输出格式与接口响应一致，data.menus 可直接作为导入文档
+
+    :param tree: export_tree 返回的菜单树
+    :return: 字符串生成器
+    """
+    yield '{"code": 200, "message": "success", "data": {"menus": ['
+    for index, item in enumerate(tree):
+        yield (',' if index else '') + json.dumps(item, ensure_ascii=False)
+    yield ']}}'
+
+
+def _path_text(path):
+    return ' > '.join(path)
+
+
+def _existing_menus():
+    """
+    按名称路径（从根到自身的label元组）索引全部未删除菜单，同级同名时取ID较小者
+    """
+    rows = Menu.objects.filter(is_deleted=0).order_by('id').values_list(
+        'id', 'parent_id', 'label', 'label_en', 'icon', 'router', 'permission__name', 'type', 'order', 'state',
+        named=True,
+    )
+    by_id = {row.id: row for row in rows}
+    paths = {}
+
+    def path_of(row):
+        if row.id not in paths:
+            # 父菜单已删除或不存在时视为根菜单
+            parent = by_id.get(row.parent_id)
+            paths[row.id] = (path_of(parent) if parent else ()) + (row.label,)
+        return paths[row.id]
+
+    existing = {}
+    for row in by_id.values():
+        existing.setdefault(path_of(row), row)
+    return existing
+
+
+def plan_import(menus):
+    """
+    比较导入文档与现有菜单，生成变更计划，不写数据库
+
+    菜单按名称路径匹配：路径已存在则更新有变化的字段，否则新建；权限按名称匹配，不存在则新建，
+    已存在且文档给出了 ruleDescription 时更新描述
+
+    :param menus: 文档中的菜单树列表
+    :return: 变更计划字典
+    :raises ValueError: 文档格式不正确
+    """
+    if not isinstance(menus, list):
+        raise ValueError('导入数据格式错误: menus 必须为数组')
+
+    existing = _existing_menus()
+    creates = []  # (层级, 路径, 节点)，按层级排列
+    updates = []  # (菜单ID, 路径, 变更字段)
+    rules = {}  # 权限名称 -> 描述
+    descriptions = {}  # 文档中显式给出的权限描述
+    seen = set()
+
+    level = [((), node) for node in menus]
+    depth = 0
+    while level:
+        next_level = []
+        for parent_path, node in level:
+            if not isinstance(node, dict) or not node.get('label') or not node.get('type'):
+                raise ValueError(f'导入数据缺少必要字段 label 或 type: {_path_text(parent_path) or "根级"}')
+            if not isinstance(node['label'], str):
+                raise ValueError(f'导入数据中 label 必须为字符串: {_path_text(parent_path) or "根级"}')
+            path = parent_path + (node['label'],)
+            if path in seen:
+                raise ValueError(f'导入数据中同级菜单名称重复: {_path_text(path)}')
+            seen.add(path)
+
+            rule = node.get('rule') or None
+            description = node.get('ruleDescription') or None
+            if rule is not None and not isinstance(rule, str):
+                raise ValueError(f'导入数据中 rule 必须为字符串: {_path_text(path)}')
+            if description is not None and not isinstance(description, str):
+                raise ValueError(f'导入数据中 ruleDescription 必须为字符串: {_path_text(path)}')
+            if not isinstance(node.get('children') or [], list):
+                raise ValueError(f'导入数据中 children 必须为数组: {_path_text(path)}')
+            if rule:
+                rules.setdefault(rule, description or f"查看{node['label']}权限")
+                if description:
+                    descriptions.setdefault(rule, description)
+
+            row = existing.get(path)
+            if row is None:
+                creates.append((depth, path, node))
+            else:
+                changes = {}
+                for key, field in _FIELDS.items():
+                    if key in node and node[key] != getattr(row, field):
+                        changes[key] = [getattr(row, field), node[key]]
+                if 'rule' in node and rule != row.permission__name:
+                    changes['rule'] = [row.permission__name, rule]
+                if changes:
+                    updates.append((row.id, path, node, changes))
+
+            for child in node.get('children') or ():
+                next_level.append((path, child))
+        level = next_level
+        depth += 1
+
+    existing_rules = dict(Permission.objects.filter(name__in=rules).values_list('name', 'description'))
+    return {
+        'existing': existing,
+        'creates': creates,
+        'updates': updates,
+        'rules': rules,
+        'new_rules': [name for name in rules if name not in existing_rules],
+        'rule_updates': {
+            name: description for name, description in descriptions.items()
+            if name in existing_rules and existing_rules[name] != description
+        },
+    }
+
+
+def summarize(plan):
+    """
+    变更计划的对外展示格式（dryRun返回的差异）
+    """
+    return {
+        'create': [_path_text(path) for _, path, _ in plan['creates']],
+        'update': [{'path': _path_text(path), 'changes': changes} for _, path, _, changes in plan['updates']],
+        'permissions': plan['new_rules'],
+        'permissionUpdates': [
+            {'rule': name, 'description': description} for name, description in plan['rule_updates'].items()
+        ],
+    }
+
+
+def apply_import(plan, role_ids):
+    """
+    在一个事务内按计划批量写入：新建权限、更新已有菜单、逐层新建菜单并写入闭包表，
+    新建菜单关联到指定角色（与新增菜单接口一致）
+
+    :param plan: plan_import 生成的变更计划
+    :param role_ids: 新建菜单要关联的角色ID列表
+    :return: (新建菜单数, 更新菜单数, 新建权限数, 更新描述的权限数)
+    """
+    rules = plan['rules']
+    with transaction.atomic():
+        Permission.objects.bulk_create(
+            [Permission(name=name, description=rules[name]) for name in plan['new_rules']],
+            batch_size=_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        permission_ids = dict(Permission.objects.filter(name__in=rules).values_list('name', 'id'))
+        Permission.objects.bulk_update(
+            [
+                Permission(id=permission_ids[name], description=description, updated_at=timezone.now())
+                for name, description in plan['rule_updates'].items()
+            ],
+            ['description', 'updated_at'],
+            batch_size=_BATCH_SIZE,
+        )
+
+        now = timezone.now()
+        updated = []
+        for menu_id, _, node, changes in plan['updates']:
+            menu = Menu(id=menu_id, updated_at=now)
+            for key in changes:
+                if key == 'rule':
+                    menu.permission_id = permission_ids.get(node.get('rule'))
+                else:
+                    setattr(menu, _FIELDS[key], node[key])
+            updated.append((menu, changes))
+        # 按变更字段组合分组批量更新，未变更的字段保持原值
+        groups = {}
+        for menu, changes in updated:
+            fields = tuple(sorted('permission' if key == 'rule' else _FIELDS[key] for key in changes))
+            groups.setdefault(fields, []).append(menu)
+        for fields, objs in groups.items():
+            Menu.objects.bulk_update(objs, [*fields, 'updated_at'], batch_size=_BATCH_SIZE)
+
+        # 逐层新建，父菜单先于子菜单写入；部分数据库不回填主键，按（父菜单, 名称）查回ID
+        menu_ids = {path: row.id for path, row in plan['existing'].items()}
+        created = []
+        levels = {}
+        for depth, path, node in plan['creates']:
+            levels.setdefault(depth, []).append((path, node))
+        for depth in sorted(levels):
+            items = levels[depth]
+            Menu.objects.bulk_create(
+                [
+                    Menu(
+                        label=node['label'],
+                        label_en=node.get('labelEn') or '',
+                        icon=node.get('icon'),
+                        router=node.get('router'),
+                        type=node['type'],
+                        order=node.get('order', 0),
+                        state=node.get('state', 1),
+                        permission_id=permission_ids.get(node.get('rule')),
+                        parent_id=menu_ids.get(path[:-1]),
+                    )
+                    for path, node in items
+                ],
+                batch_size=_BATCH_SIZE,
+            )
+            parent_ids = {menu_ids.get(path[:-1]) for path, _ in items}
+            query = Menu.objects.filter(is_deleted=0, label__in={path[-1] for path, _ in items})
+            if None in parent_ids:
+                query = query.filter(parent_id__in=parent_ids - {None}) | query.filter(parent__isnull=True)
+            else:
+                query = query.filter(parent_id__in=parent_ids)
+            # 新建的菜单ID最大，同名的已有菜单会被覆盖
+            lookup = {(parent_id, label): menu_id for menu_id, parent_id, label in
+                      query.order_by('id').values_list('id', 'parent_id', 'label')}
+            for path, _ in items:
+                parent_id = menu_ids.get(path[:-1])
+                menu_ids[path] = lookup[(parent_id, path[-1])]
+                created.append((menu_ids[path], parent_id))
+
+        closure.insert_nodes(created)
+        RoleMenu.objects.bulk_create(
+            [RoleMenu(role_id=role_id, menu_id=menu_id) for role_id in role_ids for menu_id, _ in created],
+            batch_size=_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+        # bulk_create/bulk_update 不触发信号，提交后统一使权限和菜单缓存失效
+        transaction.on_commit(permission_services.invalidate_all)
+        transaction.on_commit(invalidate_menu_snapshot)
+
+    return len(created), len(updated), len(plan['new_rules']), len(plan['rule_updates'])
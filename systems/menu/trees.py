@@ -0,0 +1,102 @@
+from collections import namedtuple
+
+from common.responses import format_datetime
+from common.tree import build_tree
+
+# 菜单树节点，rule为关联权限的名称，时间字段已格式化为字符串
+MenuNode = namedtuple('MenuNode', [
+    'id', 'parent_id', 'label', 'label_en', 'icon', 'router', 'rule',
+    'type', 'order', 'state', 'created_at', 'updated_at',
+])
+
+_FIELDS = (
+    'id', 'parent_id', 'label', 'label_en', 'icon', 'router', 'permission__name',
+    'type', 'order', 'state', 'created_at', 'updated_at',
+)
+
+
+def fetch_menu_nodes(queryset):
+    """
+    一次查询取出菜单树节点，权限名称通过关联查询取出，不产生逐条查询
+
+    :param queryset: 菜单查询集
+    :return: MenuNode列表
+    """
+    return [
+        MenuNode(*row[:10], format_datetime(row[10]), format_datetime(row[11]))
+        for row in queryset.values_list(*_FIELDS)
+    ]
+
+
+def admin_node(node):
+    """
+    菜单管理视图的节点格式
+    """
+    return {
+        'id': node.id,
+        'label': node.label,
+        'labelEn': node.label_en,
+        'icon': node.icon,
+        'router': node.router,
+        'key': node.router,  # 将router字段作为key字段返回
+        'rule': node.rule,
+        'type': node.type,
+        'order': node.order,
+        'state': node.state,
+        'createdAt': node.created_at,
+        'updatedAt': node.updated_at,
+    }
+
+
+def authorize_node(node):
+    """
+    授权视图（菜单分配树）的节点格式
+    """
+    return {
+        'title': node.label,
+        'value': str(node.id),
+        'key': str(node.id),
+        'type': node.type,
+        'icon': node.icon,
+    }
+
+
+def tree_node(node):
+    """
+    Menu.to_tree_dict 的节点格式，children字段总是返回
+    """
+    return {
+        'id': node.id,
+        'label': node.label,
+        'labelEn': node.label_en,
+        'icon': node.icon,
+        'router': node.router,
+        'rule': node.rule,
+        'type': node.type,
+        'order': node.order,
+        'state': node.state,
+        'parentId': node.parent_id,
+        'children': [],
+    }
+
+
+def by_order(node):
+    return node.order, node.id
+
+
+def by_id(node):
+    return node.id
+
+
+def build_admin_tree(nodes):
+    """
+    构建菜单管理视图的菜单树，按order排序
+    """
+    return build_tree(nodes, admin_node, by_order)
+
+
+def build_authorize_tree(nodes):
+    """
+    构建授权视图的菜单树，按菜单ID排序
+    """
+    return build_tree(nodes, authorize_node, by_id)
@@ -8,6 +8,10 @@ urlpatterns = [
     path('create', views.create, name='create'),
     path('<int:menu_id>', views.delete, name='delete'),
     path('update/<int:menu_id>', views.update, name='update'),
+    path('restore/<int:menu_id>', views.restore, name='restore'),
     path('detail', views.detail, name='detail'),
     path('changeState', views.change_state, name='change_state'),
+    path('export', views.export_menus, name='export'),
+    path('import', views.import_menus, name='import'),
+    path('reorder', views.reorder, name='reorder'),
 ]
@@ -1,9 +1,17 @@
+from django.http import StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from systems.menu.models import Menu
-from systems.role.models import Role
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+from systems.menu.models import Menu, MenuClosure, MenuClosureMissing
+from systems.role.models import RoleMenu, RolePermission
 from common.decorators import auth_required
 from common.responses import success_response, error_response, paginate_response
 from systems.permission.models import Permission
+from systems.permission import services as permission_services
+from systems.menu.snapshot import build_user_menu_tree, invalidate_menu_snapshot
+from systems.menu import closure, transfer
+from systems.menu.trees import fetch_menu_nodes, build_admin_tree
 
 # 列表接口
 @csrf_exempt
@@ -11,51 +19,10 @@ from systems.permission.models import Permission
 def list(request):
     try:
         # 获取用户的角色
-        user_roles = Role.objects.filter(users=request.current_user)
+        user_role_ids = permission_services.get_user_role_ids(request.current_user.id)
         
-        # 通过角色获取关联的菜单，只显示type<3的数据
-        user_menus = Menu.objects.filter(
-            rolemenu__role__in=user_roles,
-            is_deleted=0,
-            type__lt=3
-        ).distinct()
-        
-        # 收集所有需要显示的菜单ID
-        menu_ids_to_show = set()
-        
-        # 添加用户直接拥有的菜单
-        for menu in user_menus:
-            menu_ids_to_show.add(menu.id)
-            
-        # 添加子菜单的祖先菜单（即使用户没有直接权限）
-        for menu in user_menus:
-            ancestors = menu.get_ancestors()
-            for ancestor in ancestors:
-                # 只添加state为1的祖先菜单
-                if ancestor.state == 1 and ancestor.type < 3 and ancestor.is_deleted == 0:
-                    menu_ids_to_show.add(ancestor.id)
-        
-        # 获取所有需要显示的菜单对象
-        menus = Menu.objects.filter(
-            id__in=menu_ids_to_show,
-            is_deleted=0,
-            type__lt=3
-        ).distinct().order_by('order')
-        
-        # 构建菜单树
-        menu_tree = build_menu_tree(menus)
-        
-        # 过滤掉state为0的节点（以及它们的子节点）
-        def filter_menu_tree_by_state(items):
-            filtered_items = []
-            for item in items:
-                if item['state'] == 1:  # 只保留state为1的节点
-                    if 'children' in item:
-                        item['children'] = filter_menu_tree_by_state(item['children'])
-                    filtered_items.append(item)
-            return filtered_items
-        
-        menu_tree = filter_menu_tree_by_state(menu_tree)
+        # 从菜单快照中按角色裁剪出菜单树（只显示type<3且state为1的数据）
+        menu_tree = build_user_menu_tree(user_role_ids)
         
         return success_response(menu_tree)
         
@@ -63,65 +30,6 @@ def list(request):
         return error_response(f'服务器内部错误: {str(e)}')
 
 
-def build_menu_tree(menus):
-    """
-    构建菜单树结构
-    """
-    # 创建菜单字典，便于查找
-    menu_dict = {}
-    for menu in menus:
-        menu_data = {
-            'id': menu.id,
-            'label': menu.label,
-            'labelEn': menu.label_en,
-            'icon': menu.icon,
-            'router': menu.router,
-            'key': menu.router,  # 将router字段作为key字段返回
-            'rule': menu.permission.name if menu.permission else None,
-            'type': menu.type,
-            'order': menu.order,
-            'state': menu.state,
-            'createdAt': menu.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'updatedAt': menu.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
-        }
-        # 初始化所有节点都有children字段
-        menu_data['children'] = []
-        menu_dict[menu.id] = menu_data
-    
-    # 构建树形结构
-    tree = []
-    for menu in menus:
-        menu_data = menu_dict[menu.id]
-        # 如果有父菜单且父菜单在权限内，则添加到父菜单的children中
-        if menu.parent_id and menu.parent_id in menu_dict:
-            menu_dict[menu.parent_id]['children'].append(menu_data)
-        else:
-            # 否则作为根节点添加
-            tree.append(menu_data)
-    
-    # 移除空的children字段
-    def remove_empty_children(items):
-        for item in items:
-            if 'children' in item and item['children']:
-                remove_empty_children(item['children'])
-            elif 'children' in item and not item['children']:
-                del item['children']
-    
-    remove_empty_children(tree)
-    
-    # 按order字段排序
-    def sort_children(items):
-        if not items:
-            return
-        items.sort(key=lambda x: x['order'])
-        for item in items:
-            if 'children' in item and item['children']:
-                sort_children(item['children'])
-    
-    sort_children(tree)
-    
-    return tree
-
 # 分页接口
 @csrf_exempt
 @auth_required('GET')
@@ -136,34 +44,27 @@ def page(request):
         rule = request.GET.get('rule', '').strip()
 
         # 获取用户的角色
-        user_roles = Role.objects.filter(users=request.current_user)
+        user_role_ids = permission_services.get_user_role_ids(request.current_user.id)
         
-        # 通过角色获取关联的菜单
-        user_menus = Menu.objects.filter(
-            rolemenu__role__in=user_roles,
+        # 通过角色获取关联的菜单（子查询，不取回应用层）
+        user_menu_ids = Menu.objects.filter(
+            rolemenu__role_id__in=user_role_ids,
             is_deleted=0,
-        ).distinct()
+        ).values('id')
         
-        # 收集所有需要显示的菜单ID
-        menu_ids_to_show = set()
+        # 子菜单的祖先菜单（即使用户没有直接权限），只添加state为1的祖先菜单
+        ancestor_ids = MenuClosure.objects.filter(
+            descendant_id__in=user_menu_ids,
+            depth__gt=0,
+            ancestor__state=1,
+            ancestor__is_deleted=0,
+        ).values('ancestor_id')
         
-        # 添加用户直接拥有的菜单
-        for menu in user_menus:
-            menu_ids_to_show.add(menu.id)
-            
-        # 添加子菜单的祖先菜单（即使用户没有直接权限）
-        for menu in user_menus:
-            ancestors = menu.get_ancestors()
-            for ancestor in ancestors:
-                # 只添加state为1的祖先菜单
-                if ancestor.state == 1 and ancestor.is_deleted == 0:
-                    menu_ids_to_show.add(ancestor.id)
-        
-        # 获取所有需要显示的菜单对象
+        # 所有需要显示的菜单
         menus = Menu.objects.filter(
-            id__in=menu_ids_to_show,
+            Q(id__in=user_menu_ids) | Q(id__in=ancestor_ids),
             is_deleted=0,
-        ).distinct()
+        )
         
         if label:
             menus = menus.filter(label__icontains=label)
@@ -180,24 +81,33 @@ def page(request):
                 state_value = bool(int(state))
             menus = menus.filter(state=state_value)
         
-        # 构建菜单树
-        menu_tree = build_menu_tree(menus)
+        # 树的根节点：父菜单不在显示范围内的菜单，只对根节点过滤、计数和分页
+        roots = menus.filter(Q(parent_id__isnull=True) | ~Q(parent_id__in=menus.values('id')))
         
-        # 新增针对权限名称(rule)的过滤
+        # 针对权限名称(rule)的过滤，同时匹配菜单名称
         if rule:
-            filtered_menu_tree = [item for item in menu_tree if 
-                                 (item.get('permission') and rule.lower() in item['permission'].lower()) or
-                                 rule.lower() in str(item.get('label', '')).lower() or
-                                 rule.lower() in str(item.get('labelEn', '')).lower()]
-            menu_tree = filtered_menu_tree
+            roots = roots.filter(
+                Q(permission__name__icontains=rule) | Q(label__icontains=rule) | Q(label_en__icontains=rule)
+            )
         
         # 获取总数
-        total = len(menu_tree)
+        total = roots.count()
         
-        # 分页处理 - 只对最终结果进行分页
+        # 分页处理 - 只取当前页的根节点
         start_index = (page - 1) * page_size
         end_index = start_index + page_size
-        paginated_tree = menu_tree[start_index:end_index]
+        root_ids = [*roots.order_by('order', 'id').values_list('id', flat=True)[start_index:end_index]]
+        
+        # 只取当前页根节点的子树构建菜单树；子树中父菜单不在显示范围内的节点属于其他根节点，不在此返回
+        subtree = menus.filter(closure_ancestors__ancestor_id__in=root_ids).distinct()
+        page_root_ids = set(root_ids)
+        paginated_tree = [
+            item for item in build_admin_tree(fetch_menu_nodes(subtree))
+            if item['id'] in page_root_ids
+        ]
+        # 根节点自身的闭包行缺失时子树查不出，不返回与 total 不一致的残缺结果
+        if len(paginated_tree) != len(page_root_ids):
+            raise MenuClosureMissing(page_root_ids - {item['id'] for item in paginated_tree})
 
         return paginate_response(paginated_tree, page, page_size, total)
         
@@ -205,6 +115,17 @@ def page(request):
         return error_response(f'服务器内部错误: {str(e)}')
 
 
+# 快捷新增权限的action对应的中文名称
+ACTION_NAMES = {
+    'create': '创建权限',
+    'update': '更新权限',
+    'delete': '删除权限',
+    'detail': '详情权限',
+    'export': '导出权限',
+    'status': '状态权限'
+}
+
+
 # 添加菜单创建接口
 @csrf_exempt
 @auth_required('POST')
@@ -237,25 +158,6 @@ def create(request):
         if not rule and actions:
             return error_response('权限标识不存在则无法快捷创建权限', 400)
         
-        # 检查权限是否存在
-        if rule:
-            try:
-                # 尝试获取已存在的权限
-                permission = Permission.objects.get(name=rule)
-                # 如果权限已存在，返回错误信息
-                return error_response('权限已存在', 400, {
-                    'permission_id': permission.id,
-                    'permission_name': permission.name
-                })
-            except Permission.DoesNotExist:
-                # 权限不存在，创建新权限
-                permission = Permission.objects.create(
-                    name=rule,
-                    description=f"查看{label}权限"
-                )
-        else:
-            permission = None
-        
         # 检查父菜单是否存在
         parent_menu = None
         if parent_id:
@@ -264,92 +166,96 @@ def create(request):
             except Menu.DoesNotExist:
                 return error_response('指定的父菜单不存在', 400)
         
-        # 创建菜单
-        menu = Menu.objects.create(
-            label=label,
-            label_en=label_en,
-            type=type_val,
-            icon=icon,
-            router=router,
-            permission=permission,
-            order=order,
-            state=state,
-            parent=parent_menu
-        )
-        
-        # 处理actions参数，为每个action创建对应的权限
-        if actions and rule:
-            for action in actions:
-                # 构造权限名称 /{rule}/{action}
-                action_permission_name = f"{rule}/{action}"
+        with transaction.atomic():
+            # 检查权限是否存在
+            if rule:
                 try:
                     # 尝试获取已存在的权限
-                    action_permission = Permission.objects.get(name=action_permission_name)
+                    permission = Permission.objects.get(name=rule)
+                    # 如果权限已存在，返回错误信息
+                    return error_response('权限已存在', 400, {
+                        'permission_id': permission.id,
+                        'permission_name': permission.name
+                    })
                 except Permission.DoesNotExist:
                     # 权限不存在，创建新权限
-                    action_permission = Permission.objects.create(
-                        name=action_permission_name,
-                        description=f"{label}-{action}权限"
+                    permission = Permission.objects.create(
+                        name=rule,
+                        description=f"查看{label}权限"
                     )
-    
-        # 为当前用户的角色添加菜单关联
-        from systems.role.models import RoleMenu
-        user_roles = Role.objects.filter(users=request.current_user)
-        for role in user_roles:
-            RoleMenu.objects.get_or_create(role=role, menu=menu)
+            else:
+                permission = None
+            
+            # 创建菜单
+            menu = Menu.objects.create(
+                label=label,
+                label_en=label_en,
+                type=type_val,
+                icon=icon,
+                router=router,
+                permission=permission,
+                order=order,
+                state=state,
+                parent=parent_menu
+            )
+            
+            role_ids = permission_services.get_user_role_ids(request.current_user.id)
+            menu_ids = [menu.id]
+            action_permission_ids = []
             
-            # 如果有actions，同时为角色添加这些action权限
+            # 处理actions参数，为每个action创建对应的权限和按钮菜单（按钮菜单只创建一次，不按角色重复）
             if actions and rule:
-                for action in actions:
-                    action_permission_name = f"{rule}/{action}"
-                    try:
-                        action_permission = Permission.objects.get(name=action_permission_name)
-                        from systems.role.models import RolePermission
-                        RolePermission.objects.get_or_create(role=role, permission=action_permission)
-                    except Permission.DoesNotExist:
-                        # 如果权限不存在，则跳过
-                        pass
-
-                # 添加对应的按钮菜单
-                if actions and rule:
-                    # 定义action到中文名称的映射
-                    action_names = {
-                        'create': '创建权限',
-                        'update': '更新权限',
-                        'delete': '删除权限',
-                        'detail': '详情权限',
-                        'export': '导出权限',
-                        'status': '状态权限'
-                    }
-                    
-                    for action in actions:
-                        # 获取action对应的中文名称，默认使用action名首字母大写
-                        name = action_names.get(action, action.capitalize())
-
-                        # 为每个action创建对应的按钮类型菜单
-                        action_menu_label = f"{label}-{name}"
-                        action_permission_name = f"{rule}/{action}"
-                        
-                        # 查找对应的权限
-                        try:
-                            action_permission = Permission.objects.get(name=action_permission_name)
-                            
-                            # 创建按钮菜单
-                            button_menu = Menu.objects.create(
-                                label=action_menu_label,
-                                label_en=f"{label_en or label} {action.capitalize()}" if label_en or label else "",
-                                type=3,  # 按钮类型
-                                permission=action_permission,
-                                parent=menu,  # 父菜单为当前创建的菜单
-                                order=order,  # 使用相同排序
-                                state=state   # 使用相同状态
-                            )
-                            
-                            # 将按钮菜单与角色关联
-                            RoleMenu.objects.get_or_create(role=role, menu=button_menu)
-                        except Permission.DoesNotExist:
-                            # 如果权限不存在则跳过
-                            pass
+                actions = [*dict.fromkeys(actions)]
+                # 构造权限名称 /{rule}/{action}，已存在的权限保留
+                action_permission_names = {action: f"{rule}/{action}" for action in actions}
+                Permission.objects.bulk_create(
+                    [
+                        Permission(name=action_permission_names[action], description=f"{label}-{action}权限")
+                        for action in actions
+                    ],
+                    ignore_conflicts=True,
+                )
+                permission_ids = dict(
+                    Permission.objects.filter(name__in=action_permission_names.values()).values_list('name', 'id')
+                )
+                action_permission_ids = [*permission_ids.values()]
+                
+                # 添加对应的按钮菜单，action对应中文名称，默认使用action名首字母大写
+                Menu.objects.bulk_create([
+                    Menu(
+                        label=f"{label}-{ACTION_NAMES.get(action, action.capitalize())}",
+                        label_en=f"{label_en or label} {action.capitalize()}" if label_en or label else "",
+                        type=3,  # 按钮类型
+                        permission_id=permission_ids[action_permission_names[action]],
+                        parent=menu,  # 父菜单为当前创建的菜单
+                        order=order,  # 使用相同排序
+                        state=state   # 使用相同状态
+                    )
+                    for action in actions
+                ])
+                # bulk_create 不触发信号，且部分数据库不回填主键，按父菜单查回按钮菜单ID并写入闭包表
+                button_ids = [*Menu.objects.filter(parent=menu, type=3).values_list('id', flat=True)]
+                closure.insert_nodes([(button_id, menu.id) for button_id in button_ids])
+                menu_ids.extend(button_ids)
+            
+            # 为当前用户的角色添加菜单（含按钮菜单）关联，以及action权限关联
+            RoleMenu.objects.bulk_create(
+                [RoleMenu(role_id=role_id, menu_id=menu_id) for role_id in role_ids for menu_id in menu_ids],
+                ignore_conflicts=True,
+            )
+            if action_permission_ids:
+                RolePermission.objects.bulk_create(
+                    [
+                        RolePermission(role_id=role_id, permission_id=permission_id)
+                        for role_id in role_ids for permission_id in action_permission_ids
+                    ],
+                    ignore_conflicts=True,
+                )
+                permission_services.refresh_roles(role_ids)
+            
+            # bulk_create 不触发信号，提交后统一使权限和菜单缓存失效
+            transaction.on_commit(permission_services.invalidate_all)
+            transaction.on_commit(invalidate_menu_snapshot)
         
         # 返回成功响应
         menu_data = {
@@ -385,6 +291,13 @@ def delete(request, menu_id):
         except Menu.DoesNotExist:
             return error_response('菜单不存在', 404)
         
+        # cascade为true时一并软删除全部子孙菜单
+        if request.GET.get('cascade', '').lower() in ('1', 'true'):
+            count = Menu.objects.delete_subtree(menu.id)
+            # update 不触发信号，手动使菜单快照失效
+            invalidate_menu_snapshot()
+            return success_response({'count': count}, '菜单删除成功')
+        
         # 检查是否存在子菜单
         if menu.get_children().filter(is_deleted=False).exists():
             return error_response('存在子菜单，请先删除子菜单', 400)
@@ -398,6 +311,34 @@ def delete(request, menu_id):
     except Exception as e:
         return error_response(f'服务器内部错误: {str(e)}')
 
+# 恢复菜单接口
+@csrf_exempt
+@auth_required('PUT')
+def restore(request, menu_id):
+    try:
+        # 检查菜单是否存在，包含已软删除的记录
+        try:
+            menu = Menu.objects_with_deleted.get(id=menu_id)
+        except Menu.DoesNotExist:
+            return error_response('菜单不存在', 404)
+        
+        if not menu.is_deleted:
+            return error_response('菜单未被删除', 400)
+        
+        # cascade为true时一并恢复与它一同被删除的子孙菜单
+        if request.GET.get('cascade', '').lower() in ('1', 'true'):
+            count = Menu.objects.restore_subtree(menu)
+            # update 不触发信号，手动使菜单快照失效
+            invalidate_menu_snapshot()
+            return success_response({'count': count}, '菜单恢复成功')
+        
+        menu.restore()
+        
+        return success_response(None, '菜单恢复成功')
+        
+    except Exception as e:
+        return error_response(f'服务器内部错误: {str(e)}')
+
 # 更新菜单接口
 @csrf_exempt
 @auth_required('PUT')
@@ -436,8 +377,8 @@ def update(request, menu_id):
         if parent_id:
             try:
                 parent_menu = Menu.objects.get(id=parent_id)
-                # 检查不能将菜单设置为自己的子菜单
-                if parent_menu.id == menu.id:
+                # 检查不能将菜单设置为自己或自己子孙菜单的子菜单
+                if closure.is_descendant(parent_menu.id, menu.id):
                     return error_response('不能将菜单设置为自己的子菜单', 400)
             except Menu.DoesNotExist:
                 return error_response('指定的父菜单不存在', 400)
@@ -582,3 +523,114 @@ def detail(request):
         import traceback
         traceback.print_exc()
         return error_response(f'服务器内部错误: {str(e)}')
+
+
+# 导出菜单接口，流式返回完整菜单树及权限
+@csrf_exempt
+@auth_required('GET')
+def export_menus(request):
+    try:
+        # 先查询数据库，查询出错时在这里返回错误响应；流式阶段只做序列化
+        tree = transfer.export_tree()
+        response = StreamingHttpResponse(transfer.iter_export_json(tree), content_type='application/json')
+        response['Content-Disposition'] = 'attachment; filename="menus.json"'
+        return response
+        
+    except Exception as e:
+        return error_response(f'服务器内部错误: {str(e)}')
+
+
+# 导入菜单接口，按名称路径批量新增/更新菜单及权限，dryRun为true时只返回差异
+@csrf_exempt
+@auth_required('POST')
+def import_menus(request):
+    try:
+        # 解析请求体中的JSON数据
+        import json
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return error_response('请求数据格式错误', 400)
+        if not isinstance(data, dict):
+            return error_response('请求数据格式错误', 400)
+        
+        dry_run = data.get('dryRun', False)
+        if not isinstance(dry_run, bool):
+            return error_response('dryRun 必须为布尔值', 400)
+        
+        # 同时接受导出接口的完整响应
+        document = data.get('data', data) if isinstance(data.get('data'), dict) else data
+        
+        try:
+            plan = transfer.plan_import(document.get('menus'))
+        except ValueError as e:
+            return error_response(str(e), 400)
+        
+        diff = transfer.summarize(plan)
+        if dry_run:
+            return success_response({'dryRun': True, 'diff': diff})
+        
+        role_ids = permission_services.get_user_role_ids(request.current_user.id)
+        created, updated, permissions, permissions_updated = transfer.apply_import(plan, role_ids)
+        
+        return success_response({
+            'dryRun': False,
+            'created': created,
+            'updated': updated,
+            'permissionsCreated': permissions,
+            'permissionsUpdated': permissions_updated,
+            'diff': diff,
+        }, '菜单导入成功')
+        
+    except Exception as e:
+        return error_response(f'服务器内部错误: {str(e)}')
+
+
+# 同级菜单批量排序接口，按传入的子菜单ID顺序重写order
+@csrf_exempt
+@auth_required('PUT')
+def reorder(request):
+    try:
+        # 解析请求体中的JSON数据
+        import json
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return error_response('请求数据格式错误', 400)
+        
+        # 获取参数，parentId为空表示顶级菜单
+        parent_id = data.get('parentId') or None
+        ids = data.get('ids')
+        
+        # 参数校验
+        if not ids or isinstance(ids, (str, dict)):
+            return error_response('缺少必要参数: ids', 400)
+        try:
+            ids = [int(menu_id) for menu_id in ids]
+        except (TypeError, ValueError):
+            return error_response('ids 格式错误', 400)
+        if len(set(ids)) != len(ids):
+            return error_response('ids 中存在重复的菜单', 400)
+        
+        with transaction.atomic():
+            # 所有菜单都必须是该父菜单下未删除的子菜单
+            siblings = Menu.objects.filter(id__in=ids, parent_id=parent_id, is_deleted=0)
+            if siblings.count() != len(ids):
+                return error_response('存在不属于该父菜单的菜单', 400)
+            
+            # 一条 UPDATE ... CASE 语句写入全部新顺序
+            siblings.update(
+                order=Case(
+                    *[When(id=menu_id, then=Value(index)) for index, menu_id in enumerate(ids)],
+                    default=F('order'),
+                ),
+                updated_at=timezone.now(),
+            )
+            
+            # update 不触发信号，提交后使菜单快照失效一次
+            transaction.on_commit(invalidate_menu_snapshot)
+        
+        return success_response(None, '菜单排序成功')
+        
+    except Exception as e:
+        return error_response(f'服务器内部错误: {str(e)}')
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from systems.permission import services
+from systems.user.models import User
+
+
+class Command(BaseCommand):
+    help = '按批次重建用户有效权限物化表（user_effective_permission）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批处理的用户数')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total_added = total_removed = users = 0
+        last_id = 0
+
+        # 按主键分批，每批一次计算并在一个事务内增删差异行
+        while True:
+            user_ids = list(
+                User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not user_ids:
+                break
+            added, removed = services.refresh_users(user_ids)
+            total_added += added
+            total_removed += removed
+            users += len(user_ids)
+            last_id = user_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(
+            f'重建完成：用户 {users} 个，新增 {total_added} 行，删除 {total_removed} 行'
+        ))
@@ -0,0 +1,46 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_effective_permissions(apps, schema_editor):
+    # 直接权限 + 未删除角色的权限；user_permission 表可能由后续迁移创建，不存在时跳过
+    tables = set(schema_editor.connection.introspection.table_names())
+    grants = [
+        'SELECT ur.user_id, rp.permission_id FROM user_role ur '
+        'JOIN role_permission rp ON rp.role_id = ur.role_id '
+        'JOIN role r ON r.id = ur.role_id WHERE r.is_deleted = 0'
+    ]
+    if 'user_permission' in tables:
+        grants.append('SELECT user_id, permission_id FROM user_permission')
+    schema_editor.execute(
+        'INSERT INTO user_effective_permission (user_id, permission_id) '
+        f"SELECT user_id, permission_id FROM ({' UNION '.join(grants)}) grants"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('permission', '0001_initial'),
+        ('role', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserEffectivePermission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('permission', models.ForeignKey(db_column='permission_id', on_delete=django.db.models.deletion.CASCADE, to='permission.permission', verbose_name='权限ID')),
+                ('user', models.ForeignKey(db_column='user_id', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='用户ID')),
+            ],
+            options={
+                'verbose_name': '用户有效权限',
+                'verbose_name_plural': '用户有效权限管理',
+                'db_table': 'user_effective_permission',
+                'unique_together': {('user', 'permission')},
+            },
+        ),
+        migrations.RunPython(backfill_effective_permissions, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
@@ -25,3 +26,18 @@ class Permission(models.Model):
         
     def __str__(self):
         return self.name
+
+
+# 用户有效权限物化表（直接权限 ∪ 未删除角色的权限），由信号增量维护
+class UserEffectivePermission(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name='用户ID', db_column='user_id')
+    permission = models.ForeignKey(Permission, on_delete=models.CASCADE, verbose_name='权限ID', db_column='permission_id')
+
+    class Meta:
+        db_table = 'user_effective_permission'
+        verbose_name = '用户有效权限'
+        verbose_name_plural = '用户有效权限管理'
+        unique_together = (('user', 'permission'),)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.permission_id}"
@@ -0,0 +1,231 @@
+import threading
+import time
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from common.versioning import get_version, bump_version
+from systems.permission.models import Permission, UserEffectivePermission
+from systems.role.models import Role, RolePermission
+from systems.user.models import UserRole, UserPermission
+
+# 影响全部用户的变更（如权限改名）使用全局版本号
+GLOBAL_VERSION = 'permission:global'
+# 角色权限变更（含角色软删除）使用角色版本号，用于重建角色位图
+ROLE_VERSION = 'permission:roles'
+
+# 进程内缓存：(版本号, 构建时间, 数据)，版本号变化或超过 PERMISSION_LOCAL_TTL 秒时重建
+_local_lock = threading.Lock()
+_permission_bits = (None, 0, {})
+_role_bitsets = (None, 0, {})
+
+
+def _is_stale(entry, version):
+    return entry[0] != version or time.monotonic() - entry[1] > settings.PERMISSION_LOCAL_TTL
+
+
+def _user_version_name(user_id):
+    return f'permission:user:{user_id}'
+
+
+def _cache_key(kind, user_id):
+    return 'permission:{}:{}:{}:{}'.format(
+        kind, user_id, get_version(GLOBAL_VERSION), get_version(_user_version_name(user_id))
+    )
+
+
+def invalidate_user(user_id):
+    """
+    使单个用户的权限缓存失效
+    """
+    bump_version(_user_version_name(user_id))
+
+
+def invalidate_all():
+    """
+    使全部用户的权限缓存失效（权限本身变更时调用）
+    """
+    bump_version(GLOBAL_VERSION)
+
+
+def refresh_users(user_ids):
+    """
+    重新计算指定用户的有效权限，只增删有变化的物化行，并使这些用户的缓存失效
+
+    :param user_ids: 用户ID集合
+    :return: (新增行数, 删除行数)
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return 0, 0
+
+    with transaction.atomic():
+        desired = set(
+            UserPermission.objects.filter(user_id__in=user_ids).values_list('user_id', 'permission_id')
+        )
+        desired.update(
+            RolePermission.objects.filter(
+                role__is_deleted=0, role__userrole__user_id__in=user_ids
+            ).values_list('role__userrole__user_id', 'permission_id')
+        )
+        existing = set(
+            UserEffectivePermission.objects.filter(user_id__in=user_ids).values_list('user_id', 'permission_id')
+        )
+
+        removed = existing - desired
+        if removed:
+            by_user = {}
+            for user_id, permission_id in removed:
+                by_user.setdefault(user_id, []).append(permission_id)
+            UserEffectivePermission.objects.filter(
+                reduce(or_, (Q(user_id=u, permission_id__in=p) for u, p in by_user.items()))
+            ).delete()
+
+        added = desired - existing
+        if added:
+            UserEffectivePermission.objects.bulk_create(
+                [UserEffectivePermission(user_id=u, permission_id=p) for u, p in added],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+
+        # 事务提交后再失效缓存，避免并发请求把旧数据重新写入缓存
+        transaction.on_commit(lambda: [invalidate_user(user_id) for user_id in user_ids])
+
+    return len(added), len(removed)
+
+
+def refresh_roles(role_ids):
+    """
+    重新计算拥有指定角色的全部用户的有效权限
+
+    :param role_ids: 角色ID集合
+    :return: (新增行数, 删除行数)
+    """
+    transaction.on_commit(lambda: bump_version(ROLE_VERSION))
+    user_ids = UserRole.objects.filter(role_id__in=role_ids).values_list('user_id', flat=True)
+    return refresh_users(user_ids)
+
+
+def get_user_version(user_id):
+    """
+    获取用户权限/用户信息的版本号，角色、权限或用户本身变更后会变化
+
+    :param user_id: 用户ID
+    :return: 版本号字符串
+    """
+    return '{}.{}'.format(get_version(GLOBAL_VERSION), get_version(_user_version_name(user_id)))
+
+
+def get_user_role_ids(user_id):
+    """
+    获取用户未被软删除的角色ID列表
+
+    :param user_id: 用户ID
+    :return: 角色ID列表
+    """
+    key = _cache_key('roles', user_id)
+    role_ids = cache.get(key)
+    if role_ids is None:
+        role_ids = list(Role.objects.filter(users=user_id, is_deleted=0).values_list('id', flat=True))
+        cache.set(key, role_ids, settings.PERMISSION_CACHE_TIMEOUT)
+    return role_ids
+
+
+def get_effective_permissions(user_id):
+    """
+    获取用户的有效权限名称：直接关联的权限与未被软删除角色的权限的并集，读取物化表
+
+    :param user_id: 用户ID
+    :return: 权限名称列表（按权限ID排序）
+    """
+    key = _cache_key('effective', user_id)
+    names = cache.get(key)
+    if names is None:
+        names = list(
+            Permission.objects.filter(usereffectivepermission__user_id=user_id)
+            .order_by('id')
+            .values_list('name', flat=True)
+        )
+        cache.set(key, names, settings.PERMISSION_CACHE_TIMEOUT)
+    return names
+
+
+def get_permission_bits():
+    """
+    获取权限名称到位序号的映射，位序号即权限ID：权限增删不会改变其他权限的位序号，
+    按旧映射计算并缓存的位图在映射重建后仍然有效
+
+    版本号只在共享缓存后端中对所有进程可见，进程内缓存下由 PERMISSION_LOCAL_TTL 限定最长的过期时间
+
+    :return: {权限名称: 位序号}
+    """
+    global _permission_bits
+    version = get_version(GLOBAL_VERSION)
+    if _is_stale(_permission_bits, version):
+        bits = dict(Permission.objects.values_list('name', 'id'))
+        with _local_lock:
+            _permission_bits = (version, time.monotonic(), bits)
+    return _permission_bits[2]
+
+
+def get_role_bitsets():
+    """
+    获取全部未被软删除角色的权限位图
+
+    :return: {角色ID: 位图整数}
+    """
+    global _role_bitsets
+    version = (get_version(GLOBAL_VERSION), get_version(ROLE_VERSION))
+    if _is_stale(_role_bitsets, version):
+        bits = get_permission_bits()
+        bitsets = {}
+        rows = RolePermission.objects.filter(role__is_deleted=0).values_list('role_id', 'permission__name')
+        for role_id, name in rows:
+            # 位序号映射构建后新增的权限会在下次版本变化或映射过期时纳入
+            if name in bits:
+                bitsets[role_id] = bitsets.get(role_id, 0) | (1 << bits[name])
+        with _local_lock:
+            _role_bitsets = (version, time.monotonic(), bitsets)
+    return _role_bitsets[2]
+
+
+def get_user_bitset(user_id):
+    """
+    获取用户的有效权限位图：所属角色位图按位或，再加上直接关联的权限
+
+    :param user_id: 用户ID
+    :return: 位图整数
+    """
+    key = _cache_key('bitset', user_id)
+    bitset = cache.get(key)
+    if bitset is None:
+        bits = get_permission_bits()
+        role_bitsets = get_role_bitsets()
+        bitset = 0
+        for role_id in get_user_role_ids(user_id):
+            bitset |= role_bitsets.get(role_id, 0)
+        direct = UserPermission.objects.filter(user_id=user_id).values_list('permission__name', flat=True)
+        for name in direct:
+            if name in bits:
+                bitset |= 1 << bits[name]
+        cache.set(key, bitset, settings.PERMISSION_CACHE_TIMEOUT)
+    return bitset
+
+
+def has_perm(user, name):
+    """
+    判断用户是否拥有指定权限，缓存命中时只做一次位运算
+
+    :param user: 用户实例
+    :param name: 权限名称，如 /authority/user/create
+    :return: bool
+    """
+    bit = get_permission_bits().get(name)
+    if bit is None:
+        return False
+    return bool(get_user_bitset(user.id) >> bit & 1)
@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from common.signals import is_muted
+from systems.permission import services
+from systems.permission.models import Permission
+from systems.role.models import Role, RolePermission
+from systems.user.models import UserRole, UserPermission
+
+
+# 用户角色、用户直接权限变更只影响该用户
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+@receiver(post_save, sender=UserPermission)
+@receiver(post_delete, sender=UserPermission)
+def refresh_user_permissions(sender, instance, **kwargs):
+    services.refresh_users([instance.user_id])
+
+
+# 角色权限变更影响拥有该角色的用户
+@receiver(post_save, sender=RolePermission)
+@receiver(post_delete, sender=RolePermission)
+def refresh_role_permissions(sender, instance, **kwargs):
+    if is_muted(sender):
+        return
+    services.refresh_roles([instance.role_id])
+
+
+# 角色软删除/恢复影响拥有该角色的用户，硬删除由级联删除的UserRole处理
+@receiver(post_save, sender=Role)
+def refresh_role(sender, instance, **kwargs):
+    services.refresh_roles([instance.id])
+
+
+# 权限改名不影响物化表，只需失效缓存；删除时物化表随外键级联删除
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidate_all_permissions(sender, **kwargs):
+    transaction.on_commit(services.invalidate_all)
@@ -0,0 +1,41 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_grams(apps, schema_editor):
+    Role = apps.get_model('role', 'Role')
+    RoleSearchGram = apps.get_model('role', 'RoleSearchGram')
+    rows = []
+    for role_id, text in Role.objects.values_list('id', 'name').iterator():
+        text = (text or '').lower()
+        rows.extend(
+            RoleSearchGram(role_id=role_id, gram=gram)
+            for gram in {text[i:i + 3] for i in range(len(text) - 2)}
+        )
+    RoleSearchGram.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('role', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoleSearchGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3, verbose_name='n-gram')),
+                ('role', models.ForeignKey(db_column='role_id', on_delete=django.db.models.deletion.CASCADE, related_name='search_grams', to='role.role', verbose_name='角色ID')),
+            ],
+            options={
+                'verbose_name': '角色名搜索索引',
+                'verbose_name_plural': '角色名搜索索引管理',
+                'db_table': 'role_search_gram',
+                'indexes': [models.Index(fields=['gram', 'role'], name='role_search_gram_gram_idx')],
+                'unique_together': {('role', 'gram')},
+            },
+        ),
+        migrations.RunPython(backfill_grams, migrations.RunPython.noop),
+    ]
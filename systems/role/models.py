@@ -1,9 +1,36 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 from systems.menu.models import Menu
 from systems.permission.models import Permission
 
+class RoleManager(models.Manager):
+    """
+    角色管理器
+    """
+
+    def with_counts(self):
+        """
+        以关联子查询注解菜单数和权限数（menu_count、permission_count），不随角色数量增加查询次数
+        """
+        return self.annotate(
+            menu_count=_count_subquery(RoleMenu),
+            permission_count=_count_subquery(RolePermission),
+        )
+
+
+def _count_subquery(model):
+    counts = (
+        model.objects.filter(role_id=models.OuterRef('pk'))
+        .order_by()
+        .values('role_id')
+        .annotate(count=models.Count('*'))
+        .values('count')
+    )
+    return Coalesce(models.Subquery(counts, output_field=models.IntegerField()), 0)
+
+
 class Role(models.Model):
     id = models.BigAutoField(primary_key=True, verbose_name='角色ID')
     name = models.CharField(max_length=50, unique=True, verbose_name='角色名')
@@ -16,7 +43,7 @@ class Role(models.Model):
     deleted_at = models.DateTimeField(null=True, blank=True, verbose_name='删除时间')
     
     # 添加默认管理器，只返回未被软删除的记录
-    objects = models.Manager()
+    objects = RoleManager()
     
     # 添加一个自定义管理器，用于包含被软删除的记录
     objects_with_deleted = models.Manager()
@@ -72,4 +99,16 @@ class RoleMenu(models.Model):
         db_table = 'role_menu'
         verbose_name = '角色菜单关联'
         verbose_name_plural = '角色菜单关联管理'
-        unique_together = (('role', 'menu'),)
\ No newline at end of file
+        unique_together = (('role', 'menu'),)
+
+# 角色名 n-gram 搜索索引表，随角色保存同步维护（见 common.search）
+class RoleSearchGram(models.Model):
+    role = models.ForeignKey(Role, on_delete=models.CASCADE, related_name='search_grams', verbose_name='角色ID', db_column='role_id')
+    gram = models.CharField(max_length=3, verbose_name='n-gram')
+
+    class Meta:
+        db_table = 'role_search_gram'
+        verbose_name = '角色名搜索索引'
+        verbose_name_plural = '角色名搜索索引管理'
+        unique_together = (('role', 'gram'),)
+        indexes = [models.Index(fields=['gram', 'role'], name='role_search_gram_gram_idx')]
@@ -0,0 +1,79 @@
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q
+
+from common.signals import mute_receivers
+from systems.menu.snapshot import invalidate_menu_snapshot
+from systems.permission import services as permission_services
+from systems.role.models import RoleMenu, RolePermission
+
+
+def sync_links(model, field, role_ids, desired):
+    """
+    按集合差异同步角色关联表：只插入新增的关联、只删除移除的关联，未变化的行不动
+
+    删除时跳过逐行的缓存失效/刷新信号，调用方根据返回的差异统一处理
+
+    :param model: 关联模型，RoleMenu 或 RolePermission
+    :param field: 关联目标的字段名，如 menu_id、permission_id
+    :param role_ids: 参与同步的角色ID，这些角色原有而 desired 中没有的关联会被删除
+    :param desired: 期望的关联集合 {(角色ID, 目标ID)}
+    :return: (新增的关联集合, 删除的关联集合)
+    """
+    role_ids = set(role_ids)
+    desired = {(role_id, target_id) for role_id, target_id in desired if role_id in role_ids}
+
+    with transaction.atomic():
+        existing = set(model.objects.filter(role_id__in=role_ids).values_list('role_id', field))
+        added = desired - existing
+        removed = existing - desired
+
+        if removed:
+            by_role = {}
+            for role_id, target_id in removed:
+                by_role.setdefault(role_id, []).append(target_id)
+            queryset = model.objects.filter(
+                reduce(or_, (Q(role_id=role_id, **{f'{field}__in': targets}) for role_id, targets in by_role.items()))
+            )
+            with mute_receivers(model):
+                queryset.delete()
+
+        if added:
+            model.objects.bulk_create(
+                [model(role_id=role_id, **{field: target_id}) for role_id, target_id in added],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+
+    return added, removed
+
+
+def sync_role_menus(role_ids, desired):
+    """
+    同步角色菜单关联，有变化时在事务提交后使菜单快照失效
+
+    :param role_ids: 参与同步的角色ID
+    :param desired: 期望的关联集合 {(角色ID, 菜单ID)}
+    :return: (新增的关联集合, 删除的关联集合)
+    """
+    added, removed = sync_links(RoleMenu, 'menu_id', role_ids, desired)
+    if added or removed:
+        transaction.on_commit(invalidate_menu_snapshot)
+    return added, removed
+
+
+def sync_role_permissions(role_ids, desired):
+    """
+    同步角色权限关联，只刷新关联有变化的角色的用户有效权限
+
+    :param role_ids: 参与同步的角色ID
+    :param desired: 期望的关联集合 {(角色ID, 权限ID)}
+    :return: (新增的关联集合, 删除的关联集合)
+    """
+    added, removed = sync_links(RolePermission, 'permission_id', role_ids, desired)
+    changed_role_ids = {role_id for role_id, _ in added | removed}
+    if changed_role_ids:
+        permission_services.refresh_roles(changed_role_ids)
+    return added, removed
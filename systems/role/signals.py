@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from common import search
+from systems.role.models import Role, RoleSearchGram
+
+
+# 角色保存时同步角色名的 n-gram 搜索索引，角色名未变化时只有一次查询
+@receiver(post_save, sender=Role)
+def index_role_name(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'name' not in update_fields):
+        return
+    search.index_texts(RoleSearchGram, 'role', {instance.id: instance.name})
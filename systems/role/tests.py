@@ -1,3 +1,142 @@
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from systems.menu.models import Menu
+from systems.permission.models import Permission
+from systems.role import services
+from systems.role.models import Role, RoleMenu, RolePermission
+from systems.user.models import User
+
+
+class RoleCountQueryTests(TestCase):
+    """
+    角色分页/列表接口的菜单数、权限数统计不随角色数量增加查询次数
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='admin', password='!', status=1)
+        cls.menus = [Menu.objects.create(label=f'菜单{index}', type=2) for index in range(3)]
+        cls.permissions = [Permission.objects.create(name=f'/role-test/{index}') for index in range(2)]
+
+    def setUp(self):
+        cache.clear()
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def create_roles(self, start, stop):
+        for index in range(start, stop):
+            role = Role.objects.create(name=f'角色{index}')
+            RoleMenu.objects.bulk_create([RoleMenu(role=role, menu=menu) for menu in self.menus[:index % 4]])
+            RolePermission.objects.bulk_create(
+                [RolePermission(role=role, permission=permission) for permission in self.permissions[:index % 3]]
+            )
+
+    def get(self, url):
+        response = self.client.get(url, **self.auth).json()
+        self.assertEqual(response['code'], 200, response)
+        return response['data']
+
+    def test_page_query_count_is_constant(self):
+        for total in (5, 30):
+            self.create_roles(Role.objects.count(), total)
+            # 预热认证缓存，只统计接口本身的查询
+            self.get('/system/role/page?pageSize=50')
+            # 总数一次，当前页角色及统计一次
+            with self.assertNumQueries(2):
+                data = self.get('/system/role/page?pageSize=50')
+            self.assertEqual(data['total'], total)
+            self.assertEqual(len(data['items']), total)
+            for item in data['items']:
+                index = int(item['name'][2:])
+                self.assertEqual(item['menuCount'], index % 4)
+                self.assertEqual(item['permissionCount'], index % 3)
+
+    def test_list_roles_query_count_is_constant(self):
+        for total in (5, 30):
+            self.create_roles(Role.objects.count(), total)
+            self.get('/system/role/list')
+            with self.assertNumQueries(1):
+                items = self.get('/system/role/list')
+            self.assertEqual(len(items), total)
+            for item in items:
+                index = int(item['name'][2:])
+                self.assertEqual(item['menuCount'], index % 4)
+                self.assertEqual(item['permissionCount'], index % 3)
+
+
+class SyncLinksTests(TestCase):
+    """
+    按集合差异同步角色关联：只插入新增、只删除移除的关联，未变化的行保持不动
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.role = Role.objects.create(name='角色A')
+        cls.other = Role.objects.create(name='角色B')
+        cls.menus = [Menu.objects.create(label=f'菜单{index}', type=2) for index in range(3)]
+        cls.permissions = [Permission.objects.create(name=f'/sync-test/{index}') for index in range(3)]
+
+    def setUp(self):
+        cache.clear()
+
+    def links(self, model, field):
+        return set(model.objects.values_list('role_id', field))
+
+    def test_added_and_removed_diff(self):
+        m0, m1, m2 = (menu.id for menu in self.menus)
+        RoleMenu.objects.bulk_create([
+            RoleMenu(role=self.role, menu_id=m0),
+            RoleMenu(role=self.role, menu_id=m1),
+            RoleMenu(role=self.other, menu_id=m0),
+        ])
+        kept = RoleMenu.objects.get(role=self.role, menu_id=m0).pk
+
+        added, removed = services.sync_links(
+            RoleMenu, 'menu_id', [self.role.id], {(self.role.id, m0), (self.role.id, m2), (self.other.id, m1)},
+        )
+        self.assertEqual(added, {(self.role.id, m2)})
+        self.assertEqual(removed, {(self.role.id, m1)})
+        # 不在 role_ids 中的角色既不新增也不删除关联
+        self.assertEqual(
+            self.links(RoleMenu, 'menu_id'),
+            {(self.role.id, m0), (self.role.id, m2), (self.other.id, m0)},
+        )
+        # 未变化的关联行没有被删除重建
+        self.assertEqual(RoleMenu.objects.get(role=self.role, menu_id=m0).pk, kept)
+
+    def test_unchanged_sync_is_noop(self):
+        RoleMenu.objects.create(role=self.role, menu=self.menus[0])
+        desired = {(self.role.id, self.menus[0].id)}
+        with self.assertNumQueries(3):
+            added, removed = services.sync_links(RoleMenu, 'menu_id', [self.role.id], desired)
+        self.assertEqual((added, removed), (set(), set()))
+
+    def test_sync_role_permissions_refreshes_changed_roles_only(self):
+        p0, p1, p2 = (permission.id for permission in self.permissions)
+        RolePermission.objects.bulk_create([
+            RolePermission(role=self.role, permission_id=p0),
+            RolePermission(role=self.other, permission_id=p0),
+        ])
+
+        with mock.patch('systems.role.services.permission_services.refresh_roles') as refresh_roles:
+            added, removed = services.sync_role_permissions(
+                [self.role.id, self.other.id],
+                {(self.role.id, p1), (self.role.id, p2), (self.other.id, p0)},
+            )
+            self.assertEqual(added, {(self.role.id, p1), (self.role.id, p2)})
+            self.assertEqual(removed, {(self.role.id, p0)})
+            refresh_roles.assert_called_once_with({self.role.id})
+
+            # 没有变化时不刷新
+            refresh_roles.reset_mock()
+            services.sync_role_permissions([self.other.id], {(self.other.id, p0)})
+            refresh_roles.assert_not_called()
 
-# Create your tests here.
+        self.assertEqual(
+            self.links(RolePermission, 'permission_id'),
+            {(self.role.id, p1), (self.role.id, p2), (self.other.id, p0)},
+        )
@@ -1,9 +1,16 @@
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 from systems.menu.models import Menu
-from systems.role.models import Role, RolePermission, RoleMenu
+from systems.role.models import Role, RolePermission, RoleMenu, RoleSearchGram
 from common.decorators import auth_required
-from common.responses import success_response, error_response, paginate_response, model_to_dict
+from django.db import transaction
+from systems.permission import services as permission_services
+from systems.role import services as role_services
+from systems.menu.snapshot import invalidate_menu_snapshot
+from systems.menu.trees import fetch_menu_nodes, build_authorize_tree
+from common import metrics, search
+from common.responses import success_response, error_response, paginate_response, cursor_paginate_response, model_to_dict
+from common.pagination import keyset_page, InvalidPagination
 
 # 列表接口
 @csrf_exempt
@@ -15,38 +22,44 @@ def page(request):
         page_size = int(request.GET.get('pageSize', 10))
         name = request.GET.get('name', '').strip()
 
-        # 构建查询条件，只显示未被软删除的角色
-        roles = Role.objects.filter(is_deleted=0)
+        # 构建查询条件，只显示未被软删除的角色；关联的菜单数量和权限数量在同一条查询中以子查询统计
+        roles = Role.objects.with_counts().filter(is_deleted=0)
         
-        # 根据角色名称进行过滤
+        # 根据角色名称进行过滤，使用 n-gram 索引并按匹配质量排序
         if name:
-            roles = roles.filter(name__icontains=name)
-        
-        # 获取总数
-        total = roles.count()
-        
-        # 分页处理
-        start_index = (page - 1) * page_size
-        end_index = start_index + page_size
-        paginated_roles = roles[start_index:end_index]
+            roles = search.search(roles, 'name', RoleSearchGram, 'role', name)
+        
+        # 游标分页：按ID从游标之后取一页，不使用OFFSET，总数仅在 withTotal=true 时统计
+        if 'cursor' in request.GET:
+            # 游标按ID排序，会丢弃搜索结果的匹配质量排序，两者不能同时使用
+            if name:
+                return error_response('按角色名称搜索时不支持游标分页，请使用 page 参数', 400)
+            total = roles.count() if request.GET.get('withTotal') == 'true' else None
+            paginated_roles, next_cursor = keyset_page(roles, request.GET['cursor'], page_size)
+        else:
+            # 获取总数
+            total = roles.count()
+
+            # 分页处理
+            start_index = (page - 1) * page_size
+            end_index = start_index + page_size
+            paginated_roles = roles[start_index:end_index]
         
         # 构建返回数据
         role_items = []
         for role in paginated_roles:
-            # 获取角色关联的权限数量
-            permission_count = role.rolepermission_set.count()
-            
-            # 获取角色关联的菜单数量
-            menu_count = role.rolemenu_set.count()
-
             role_data = model_to_dict(role)
-            role_data['menuCount'] = menu_count
-            role_data['permissionCount'] = permission_count
+            role_data['menuCount'] = role.menu_count
+            role_data['permissionCount'] = role.permission_count
             
             role_items.append(role_data)
         
+        if 'cursor' in request.GET:
+            return cursor_paginate_response(role_items, page_size, next_cursor, total)
         return paginate_response(role_items, page, page_size, total)
 
+    except InvalidPagination as e:
+        return error_response(str(e), 400)
     except Exception as e:
         return error_response(f'服务器内部错误: {str(e)}')
 
@@ -109,10 +122,14 @@ def create(request):
             # 批量创建菜单关联
             if role_menus:
                 RoleMenu.objects.bulk_create(role_menus)
+                # bulk_create 不触发信号，手动使菜单快照失效
+                invalidate_menu_snapshot()
             
             # 批量创建权限关联
             if role_permissions:
                 RolePermission.objects.bulk_create(role_permissions)
+                # bulk_create 不触发信号，手动刷新有效权限
+                permission_services.refresh_roles([role.id])
         
         # 返回成功响应
         role_data = model_to_dict(role)
@@ -158,44 +175,22 @@ def update(request, role_id):
         role.description = description
         role.save()
         
-        # 处理菜单关联 - 先删除原有的关联，再创建新的关联
+        # 处理菜单关联 - 按差异同步，只增删有变化的关联
         if authorize is not None:
-            # 删除原有的角色菜单关联
-            RoleMenu.objects.filter(role=role).delete()
-            # 删除原有的角色权限关联
-            RolePermission.objects.filter(role=role).delete()
+            # 获取菜单及其关联的权限
+            menus = Menu.objects.filter(id__in=authorize, is_deleted=0).values_list('id', 'permission_id')
             
-            # 创建新的菜单关联
-            if authorize:
-                # 获取菜单对象列表
-                menus = Menu.objects.filter(id__in=authorize, is_deleted=0)
-                
-                # 创建角色菜单关联
-                role_menus = []
-                role_permissions = []
-                processed_permissions = set()  # 用于跟踪已处理的权限ID，避免重复
-                
-                for menu in menus:
-                    role_menus.append(RoleMenu(
-                        role=role,
-                        menu=menu
-                    ))
-                    
-                    # 如果菜单有关联权限，则也关联到角色
-                    if menu.permission and menu.permission.id not in processed_permissions:
-                        role_permissions.append(RolePermission(
-                            role=role,
-                            permission=menu.permission
-                        ))
-                        processed_permissions.add(menu.permission.id)  # 记录已处理的权限ID
-                
-                # 批量创建菜单关联
-                if role_menus:
-                    RoleMenu.objects.bulk_create(role_menus)
-                
-                # 批量创建权限关联
-                if role_permissions:
-                    RolePermission.objects.bulk_create(role_permissions)
+            menu_links = set()
+            permission_links = set()
+            for menu_id, permission_id in menus:
+                menu_links.add((role.id, menu_id))
+                # 如果菜单有关联权限，则也关联到角色
+                if permission_id:
+                    permission_links.add((role.id, permission_id))
+            
+            with transaction.atomic():
+                role_services.sync_role_menus([role.id], menu_links)
+                role_services.sync_role_permissions([role.id], permission_links)
         
         # 返回成功响应
         role_data = model_to_dict(role)
@@ -238,13 +233,15 @@ def detail(request):
 @auth_required('GET')
 def list_roles(request):
     try:
-        # 获取所有未被软删除的角色
-        roles = Role.objects.filter(is_deleted=0)
+        # 获取所有未被软删除的角色，附带关联的菜单数量和权限数量
+        roles = Role.objects.with_counts().filter(is_deleted=0)
         
         # 构建返回数据
         role_items = []
         for role in roles:
             role_data = model_to_dict(role)
+            role_data['menuCount'] = role.menu_count
+            role_data['permissionCount'] = role.permission_count
             role_items.append(role_data)
         
         return success_response(role_items)
@@ -281,58 +278,6 @@ def delete(request, role_id):
             'data': {}
         })
 
-def build_menu_tree_for_role(menus):
-    """
-    为角色构建菜单树结构，用于菜单分配
-    """
-    # 创建菜单字典，便于查找
-    menu_dict = {}
-    for menu in menus:
-        menu_data = {
-            'title': menu.label,
-            'value': str(menu.id),
-            'key': str(menu.id),
-            'type': menu.type,
-            'icon': menu.icon,
-        }
-        # 初始化所有节点都有children字段
-        menu_data['children'] = []
-        menu_dict[menu.id] = menu_data
-    
-    # 构建树形结构
-    tree = []
-    for menu in menus:
-        menu_data = menu_dict[menu.id]
-        # 如果有父菜单且父菜单在权限内，则添加到父菜单的children中
-        if menu.parent_id and menu.parent_id in menu_dict:
-            menu_dict[menu.parent_id]['children'].append(menu_data)
-        else:
-            # 否则作为根节点添加
-            tree.append(menu_data)
-    
-    # 移除空的children字段
-    def remove_empty_children(items):
-        for item in items:
-            if 'children' in item and item['children']:
-                remove_empty_children(item['children'])
-            elif 'children' in item and not item['children']:
-                del item['children']
-    
-    remove_empty_children(tree)
-    
-    # 按照菜单顺序排序
-    def sort_children(items):
-        if not items:
-            return
-        items.sort(key=lambda x: int(x['value']))  # 按菜单ID排序
-        for item in items:
-            if 'children' in item and item['children']:
-                sort_children(item['children'])
-    
-    sort_children(tree)
-    
-    return tree
-
 # 获取角色权限接口
 @csrf_exempt
 @auth_required('GET')
@@ -351,19 +296,13 @@ def authorize(request):
             is_deleted=0
         ).distinct().order_by('order')
 
-        
+        menu_nodes = fetch_menu_nodes(all_menus)
+
         # 构建完整的菜单树结构
-        tree_data = build_menu_tree_for_role(all_menus)
+        tree_data = build_authorize_tree(menu_nodes)
         
-        # 获取指定角色已有的权限菜单
-        default_checked_keys = []
-        role_menus = Menu.objects.filter(
-            rolemenu__role__id=role_id,
-            is_deleted=0
-        ).distinct()
-        
-        # 提取菜单ID作为默认选中的键
-        default_checked_keys = [str(menu.id) for menu in role_menus]
+        # 指定角色已有的权限菜单即上面查询到的菜单，提取菜单ID作为默认选中的键
+        default_checked_keys = [str(node.id) for node in menu_nodes]
         
         return success_response({
             'defaultCheckedKeys': default_checked_keys,
@@ -377,6 +316,7 @@ def authorize(request):
 # 保存用户菜单权限接口
 @csrf_exempt
 @auth_required('PUT')
+@metrics.timer('role.save_authorize')
 def save_authorize(request):
     try:
         # 解析请求体中的JSON数据
@@ -402,28 +342,18 @@ def save_authorize(request):
             return error_response('用户不存在', 404)
         
         # 获取用户当前的角色
-        user_roles = user.roles.filter(is_deleted=0)
-        if not user_roles.exists():
+        role_ids = [*user.roles.filter(is_deleted=0).values_list('id', flat=True)]
+        if not role_ids:
             return error_response('用户未分配角色', 400)
         
-        # 删除用户角色原有的菜单关联
-        from systems.role.models import RoleMenu
-        RoleMenu.objects.filter(role__in=user_roles).delete()
-        
-        # 为用户角色添加新的菜单关联
-        role_menus = []
-        for role in user_roles:
-            for menu_id in menu_ids:
-                try:
-                    menu = Menu.objects.get(id=menu_id, is_deleted=0)
-                    role_menus.append(RoleMenu(role=role, menu=menu))
-                except Menu.DoesNotExist:
-                    # 如果菜单不存在，则跳过
-                    pass
-        
-        # 批量创建角色菜单关联
-        if role_menus:
-            RoleMenu.objects.bulk_create(role_menus)
+        # 一次查询校验菜单，不存在或已删除的菜单跳过
+        valid_menu_ids = Menu.objects.filter(id__in=menu_ids, is_deleted=0).values_list('id', flat=True)
+        
+        # 在内存中构建角色×菜单的关联集合
+        menu_links = {(role_id, menu_id) for menu_id in valid_menu_ids for role_id in role_ids}
+        
+        # 按差异同步角色菜单关联，在一个事务内批量写入
+        role_services.sync_role_menus(role_ids, menu_links)
         
         return success_response(None, '用户菜单权限保存成功')
         
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'systems.user'
+
+    def ready(self):
+        # 注册信号处理函数
+        from . import signals  # noqa: F401
@@ -0,0 +1,204 @@
+import codecs
+import csv
+import json
+import re
+
+from django.db import transaction
+
+from common import search
+from common.hashing import HashPoolBusy, hash_passwords
+from systems.permission import services as permission_services
+from systems.role.models import Role
+from systems.user.models import User, UserRole, UserSearchGram
+
+# 导入文档中的用户字段：文档字段名 -> 模型字段名
+_FIELDS = {
+    'username': 'username',
+    'name': 'name',
+    'email': 'email',
+    'phone': 'phone',
+}
+
+_BATCH_SIZE = 1000
+
+# 响应中最多返回的错误行数，超出部分只计入 failed
+_MAX_ERRORS = 1000
+
+
+def iter_records(lines, fmt):
+    """
+    逐行解析导入文档，不把整个文档读入内存
+
+    CSV 首行为表头（username,password,name,email,phone,status,roleIds），roleIds 以 | 分隔；
+    NDJSON 每行一个JSON对象，roleIds 为数组
+
+    :param lines: 按行迭代的字节流，如 request 或以二进制打开的文件
+    :param fmt: csv 或 ndjson
+    :return: (行号, 记录字典) 生成器，无法解析的行记录为None
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(codecs.iterdecode(lines, 'utf-8-sig'))
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_no, record if isinstance(record, dict) else None
+
+
+def _clean(record, role_ids):
+    """
+    校验并规范化一条记录
+
+    :return: (模型字段字典, 明文密码, 角色ID列表)
+    :raises ValueError: 记录不合法
+    """
+    if record is None:
+        raise ValueError('无法解析的行')
+
+    values = {}
+    for key, field in _FIELDS.items():
+        value = record.get(key)
+        value = str(value).strip() if value not in (None, '') else None
+        max_length = User._meta.get_field(field).max_length
+        if value and len(value) > max_length:
+            raise ValueError(f'{key} 长度不能超过{max_length}')
+        values[field] = value
+    if not values['username']:
+        raise ValueError('用户名不能为空')
+
+    password = record.get('password')
+    if not password:
+        raise ValueError('密码不能为空')
+
+    status = record.get('status')
+    try:
+        values['status'] = 1 if status in (None, '') else int(status)
+    except (TypeError, ValueError):
+        raise ValueError('status 只能为0或1')
+    if values['status'] not in (0, 1):
+        raise ValueError('status 只能为0或1')
+
+    roles = record.get('roleIds') or []
+    if isinstance(roles, str):
+        roles = [role for role in re.split(r'[|;,\s]+', roles) if role]
+    try:
+        roles = {int(role) for role in roles}
+    except (TypeError, ValueError):
+        raise ValueError('roleIds 格式错误')
+    missing = roles - role_ids
+    if missing:
+        raise ValueError(f"角色不存在: {', '.join(str(role) for role in sorted(missing))}")
+
+    return values, str(password), sorted(roles)
+
+
+def _import_batch(batch, executor, errors):
+    """
+    导入一批已校验的记录：先在进程池中并行哈希密码，再在一个事务内批量写入用户和角色关联
+
+    :param batch: [(行号, 模型字段字典, 明文密码, 角色ID列表)]
+    :param executor: 独立的进程池，为None时使用共享的密码哈希进程池
+    :param errors: 错误列表，失败的行追加到其中
+    :return: 新建的用户数
+    """
+    existing = set(
+        User.objects.filter(username__in=[values['username'] for _, values, _, _ in batch])
+        .values_list('username', flat=True)
+    )
+    rows = []
+    for line_no, values, password, roles in batch:
+        if values['username'] in existing:
+            errors.append((line_no, values['username'], '用户名已存在'))
+        else:
+            rows.append((line_no, values, password, roles))
+    if not rows:
+        return 0
+
+    try:
+        hashes = hash_passwords([password for _, _, password, _ in rows], executor=executor)
+    except HashPoolBusy:
+        errors.extend((line_no, values['username'], '请求繁忙，请稍后重试') for line_no, values, _, _ in rows)
+        return 0
+
+    with transaction.atomic():
+        # 并发创建了同名用户时忽略冲突，随后按（用户名, 密码哈希）查回本次写入的用户ID
+        User.objects.bulk_create(
+            [User(password=encoded, **values) for (_, values, _, _), encoded in zip(rows, hashes)],
+            batch_size=_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        created = {
+            (username, encoded): user_id for user_id, username, encoded in
+            User.objects.filter(username__in=[values['username'] for _, values, _, _ in rows])
+            .values_list('id', 'username', 'password')
+        }
+
+        user_roles = []
+        usernames = {}
+        for (line_no, values, _, roles), encoded in zip(rows, hashes):
+            user_id = created.get((values['username'], encoded))
+            if user_id is None:
+                errors.append((line_no, values['username'], '用户名已存在'))
+                continue
+            usernames[user_id] = values['username']
+            user_roles.extend(UserRole(user_id=user_id, role_id=role_id) for role_id in roles)
+
+        UserRole.objects.bulk_create(user_roles, batch_size=_BATCH_SIZE, ignore_conflicts=True)
+        # bulk_create 不触发信号，手动写入用户名搜索索引并刷新有效权限
+        search.index_texts(UserSearchGram, 'user', usernames)
+        permission_services.refresh_users({user_role.user_id for user_role in user_roles})
+
+    return len(usernames)
+
+
+def import_users(records, executor=None):
+    """
+    流式批量导入用户：逐批校验、哈希密码并写入，每批一个事务，某行出错不影响其他行
+
+    :param records: iter_records 生成的 (行号, 记录字典)
+    :param executor: 独立的进程池（管理命令使用），为None时使用共享的密码哈希进程池
+    :return: 导入结果字典 {total, created, failed, errors}
+    """
+    role_ids = set(Role.objects.filter(is_deleted=0).values_list('id', flat=True))
+    seen = set()
+    errors = []
+    total = created = 0
+    batch = []
+
+    for line_no, record in records:
+        total += 1
+        try:
+            values, password, roles = _clean(record, role_ids)
+        except ValueError as e:
+            errors.append((line_no, (record or {}).get('username'), str(e)))
+            continue
+        if values['username'] in seen:
+            errors.append((line_no, values['username'], '文件中用户名重复'))
+            continue
+        seen.add(values['username'])
+
+        batch.append((line_no, values, password, roles))
+        if len(batch) >= _BATCH_SIZE:
+            created += _import_batch(batch, executor, errors)
+            batch = []
+    if batch:
+        created += _import_batch(batch, executor, errors)
+
+    errors.sort(key=lambda error: error[0])
+    return {
+        'total': total,
+        'created': created,
+        'failed': len(errors),
+        'errors': [
+            {'line': line_no, 'username': username, 'message': message}
+            for line_no, username, message in errors[:_MAX_ERRORS]
+        ],
+    }
@@ -0,0 +1,45 @@
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from systems.user import importer
+
+
+class Command(BaseCommand):
+    help = '从 CSV 或 NDJSON 文件流式批量导入用户，密码在独立的进程池中并行哈希'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='导入文件路径，- 表示标准输入')
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help='文件格式，默认按扩展名判断')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='哈希密码的进程数，默认为CPU核数')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        if options['workers'] < 1:
+            raise CommandError('--workers 必须大于0')
+
+        # 离线导入不与登录请求争用共享的密码哈希进程池，使用独立的进程池
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context(settings.PASSWORD_HASH_POOL['START_METHOD']),
+        ) as executor:
+            if path == '-':
+                result = importer.import_users(importer.iter_records(sys.stdin.buffer, fmt), executor)
+            else:
+                try:
+                    stream = open(path, 'rb')
+                except OSError as e:
+                    raise CommandError(f'无法打开文件: {e}')
+                with stream:
+                    result = importer.import_users(importer.iter_records(stream, fmt), executor)
+
+        for error in result['errors']:
+            self.stderr.write(f"第{error['line']}行 {error['username'] or ''}: {error['message']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"导入完成：共 {result['total']} 行，成功 {result['created']} 行，失败 {result['failed']} 行"
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from common import search
+from systems.role.models import Role, RoleSearchGram
+from systems.user.models import User, UserSearchGram
+
+
+class Command(BaseCommand):
+    help = '全量重建用户名、角色名的 n-gram 搜索索引表（user_search_gram、role_search_gram）'
+
+    def handle(self, *args, **options):
+        users = search.rebuild_index(UserSearchGram, 'user', User.objects.all(), 'username')
+        roles = search.rebuild_index(RoleSearchGram, 'role', Role.objects_with_deleted.all(), 'name')
+        self.stdout.write(self.style.SUCCESS(f'重建完成：用户名索引 {users} 行，角色名索引 {roles} 行'))
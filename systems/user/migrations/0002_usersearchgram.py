@@ -0,0 +1,41 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_grams(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    UserSearchGram = apps.get_model('user', 'UserSearchGram')
+    rows = []
+    for user_id, text in User.objects.values_list('id', 'username').iterator():
+        text = (text or '').lower()
+        rows.extend(
+            UserSearchGram(user_id=user_id, gram=gram)
+            for gram in {text[i:i + 3] for i in range(len(text) - 2)}
+        )
+    UserSearchGram.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3, verbose_name='n-gram')),
+                ('user', models.ForeignKey(db_column='user_id', on_delete=django.db.models.deletion.CASCADE, related_name='search_grams', to='user.user', verbose_name='用户ID')),
+            ],
+            options={
+                'verbose_name': '用户名搜索索引',
+                'verbose_name_plural': '用户名搜索索引管理',
+                'db_table': 'user_search_gram',
+                'indexes': [models.Index(fields=['gram', 'user'], name='user_search_gram_gram_idx')],
+                'unique_together': {('user', 'gram')},
+            },
+        ),
+        migrations.RunPython(backfill_grams, migrations.RunPython.noop),
+    ]
@@ -80,4 +80,17 @@ class UserPermission(models.Model):
 
     class Meta:
         db_table = 'user_permission'
-        verbose_name = '用户权限'
\ No newline at end of file
+        verbose_name = '用户权限'
+
+
+# 用户名 n-gram 搜索索引表，随用户保存同步维护（见 common.search）
+class UserSearchGram(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_grams', verbose_name='用户ID', db_column='user_id')
+    gram = models.CharField(max_length=3, verbose_name='n-gram')
+
+    class Meta:
+        db_table = 'user_search_gram'
+        verbose_name = '用户名搜索索引'
+        verbose_name_plural = '用户名搜索索引管理'
+        unique_together = (('user', 'gram'),)
+        indexes = [models.Index(fields=['gram', 'user'], name='user_search_gram_gram_idx')]
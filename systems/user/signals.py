@@ -0,0 +1,23 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from common import search
+from common.principal import invalidate_principal
+from systems.permission import services as permission_services
+from systems.user.models import User, UserSearchGram
+
+
+# 用户保存（包括软删除、禁用）或删除时清除认证缓存，并更新用户信息版本号
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_principal(sender, instance, **kwargs):
+    invalidate_principal(instance.id)
+    permission_services.invalidate_user(instance.id)
+
+
+# 用户保存时同步用户名的 n-gram 搜索索引，用户名未变化时只有一次查询
+@receiver(post_save, sender=User)
+def index_username(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'username' not in update_fields):
+        return
+    search.index_texts(UserSearchGram, 'user', {instance.id: instance.username})
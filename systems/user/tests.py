@@ -1,3 +1,210 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from common import throttle
+from common.pagination import encode_cursor
+from common.throttle import LocalTokenBucket
+from systems.user.models import User
+
+THROTTLE = {
+    'BACKEND': 'local',
+    'MAX_KEYS': 100,
+    'RATES': {
+        'login_ip': {'CAPACITY': 100, 'REFILL_PER_MINUTE': 60},
+        'login_username': {'CAPACITY': 3, 'REFILL_PER_MINUTE': 60},
+    },
+}
+
+
+class TokenBucketTests(TestCase):
+    """
+    令牌桶：容量耗尽后拒绝，随时间按速率恢复
+    """
+
+    def test_lockout_and_refill(self):
+        bucket = LocalTokenBucket(max_keys=10)
+        with mock.patch('common.throttle.time.monotonic', return_value=1000.0) as clock:
+            self.assertEqual([bucket.consume('k', 3, 1) for _ in range(4)], [True, True, True, False])
+
+            # 0.5秒只恢复半个令牌，仍然拒绝
+            clock.return_value = 1000.5
+            self.assertFalse(bucket.consume('k', 3, 1))
+
+            # 累计恢复到1个令牌后放行一次
+            clock.return_value = 1001.5
+            self.assertTrue(bucket.consume('k', 3, 1))
+            self.assertFalse(bucket.consume('k', 3, 1))
+
+            # 恢复不超过容量
+            clock.return_value = 2000.0
+            self.assertEqual([bucket.consume('k', 3, 1) for _ in range(4)], [True, True, True, False])
+
+    def test_keys_are_independent_and_bounded(self):
+        bucket = LocalTokenBucket(max_keys=2)
+        with mock.patch('common.throttle.time.monotonic', return_value=0.0):
+            self.assertTrue(bucket.consume('a', 1, 1))
+            self.assertFalse(bucket.consume('a', 1, 1))
+            self.assertTrue(bucket.consume('b', 1, 1))
+            self.assertTrue(bucket.consume('c', 1, 1))
+            # 超过 max_keys 时淘汰最久未使用的桶
+            self.assertEqual(len(bucket._buckets), 2)
+
+
+@override_settings(THROTTLE=THROTTLE)
+class LoginThrottleTests(TestCase):
+    """
+    登录接口按用户名限流，超出后在查询用户和计算哈希之前返回429
+    """
+
+    def setUp(self):
+        cache.clear()
+        throttle._backend = None
+        self.addCleanup(setattr, throttle, '_backend', None)
+
+    def login(self, username):
+        return self.client.post(
+            '/system/user/login', json.dumps({'username': username, 'password': 'wrong'}),
+            content_type='application/json',
+        ).json()
+
+    def test_username_lockout_and_refill(self):
+        with mock.patch('common.throttle.time.monotonic', return_value=1000.0) as clock:
+            codes = [self.login('nobody')['code'] for _ in range(4)]
+            self.assertEqual(codes, [500, 500, 500, 429])
+
+            # 其他用户名不受影响
+            self.assertEqual(self.login('someone')['code'], 500)
+
+            # 每分钟恢复60个令牌，1秒后恢复一次尝试机会
+            clock.return_value = 1001.0
+            self.assertEqual(self.login('nobody')['code'], 500)
+            self.assertEqual(self.login('nobody')['code'], 429)
+
+
+class CursorPageTests(TestCase):
+    """
+    用户分页接口的游标模式：逐页遍历不重不漏，非法游标和页面大小返回400
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='admin', password='!', status=1)
+        for index in range(6):
+            User.objects.create(username=f'cursor{index}', password='!', status=1)
+        User.objects.create(username='removed', password='!', status=1, is_deleted=1)
+
+    def setUp(self):
+        cache.clear()
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def get(self, url):
+        return self.client.get(url, **self.auth).json()
+
+    def test_round_trip(self):
+        ids = []
+        cursor = ''
+        pages = 0
+        while cursor is not None:
+            response = self.get(f'/system/user/page?pageSize=3&cursor={cursor}&withTotal={str(not pages).lower()}')
+            self.assertEqual(response['code'], 200, response)
+            data = response['data']
+            if pages == 0:
+                self.assertEqual(data['total'], 7)
+            else:
+                self.assertNotIn('total', data)
+            ids.extend(item['id'] for item in data['items'])
+            cursor = data['nextCursor']
+            pages += 1
+
+        expected = list(User.objects.filter(is_deleted=0).order_by('id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+    def test_invalid_cursor(self):
+        for cursor in ('not-a-cursor!', encode_cursor([1, 2]), encode_cursor(['abc'])):
+            with self.subTest(cursor=cursor):
+                response = self.get(f'/system/user/page?cursor={cursor}')
+                self.assertEqual(response['code'], 400, response)
+
+    def test_invalid_page_size(self):
+        for page_size in (0, -1):
+            with self.subTest(page_size=page_size):
+                response = self.get(f'/system/user/page?cursor=&pageSize={page_size}')
+                self.assertEqual(response['code'], 400, response)
+
+    def test_search_rejects_cursor(self):
+        response = self.get('/system/user/page?cursor=&username=cursor')
+        self.assertEqual(response['code'], 400, response)
+
+
+def _hash_inline(passwords, executor=None):
+    # 测试中不启动密码哈希进程池，在当前进程内用 PASSWORD_HASHERS 中的快速哈希器计算
+    return [make_password(password) for password in passwords]
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+@mock.patch('systems.user.importer.hash_passwords', _hash_inline)
+class ImportUsersTests(TestCase):
+    """
+    用户批量导入接口：CSV/NDJSON 中校验失败的行单独报告，不影响其他行；过大的请求体在读取前拒绝
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='admin', password='!', status=1)
+
+    def setUp(self):
+        cache.clear()
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def post(self, body, content_type, **extra):
+        return self.client.post('/system/user/import', body, content_type=content_type, **self.auth, **extra).json()
+
+    def assert_imported(self, response):
+        self.assertEqual(response['code'], 200, response)
+        self.assertEqual(
+            {key: response['data'][key] for key in ('total', 'created', 'failed')},
+            {'total': 3, 'created': 2, 'failed': 1},
+        )
+        self.assertEqual(response['data']['errors'], [{'line': 3, 'username': 'bad', 'message': 'status 只能为0或1'}])
+        self.assertFalse(User.objects.filter(username='bad').exists())
+
+        imported = User.objects.get(username='alice')
+        self.assertEqual(imported.name, 'Alice')
+        self.assertTrue(imported.check_password('secret1'))
+        self.assertTrue(imported.search_grams.filter(gram='lic').exists())
+
+    def test_csv_with_invalid_row(self):
+        body = (
+            'username,password,name,status\n'
+            'alice,secret1,Alice,1\n'
+            'bad,secret2,Bad,5\n'
+            'bob,secret3,Bob,0\n'
+        )
+        self.assert_imported(self.post(body, 'text/csv'))
+        self.assertEqual(User.objects.get(username='bob').status, 0)
+
+    def test_ndjson_with_invalid_row(self):
+        body = '\n'.join([
+            json.dumps({'username': 'alice', 'password': 'secret1', 'name': 'Alice'}),
+            '',
+            json.dumps({'username': 'bad', 'password': 'secret2', 'status': 5}),
+            json.dumps({'username': 'bob', 'password': 'secret3'}),
+        ])
+        # 空行不计入总数，但行号按原文件计算
+        self.assert_imported(self.post(body, 'application/x-ndjson'))
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=64)
+    def test_oversized_body_is_rejected_before_reading(self):
+        body = 'username,password\n' + 'x' * 100 + ',secret\n'
+        with mock.patch('systems.user.importer.iter_records') as iter_records:
+            response = self.post(body, 'text/csv')
+        self.assertEqual(response['code'], 413, response)
+        iter_records.assert_not_called()
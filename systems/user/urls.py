@@ -11,6 +11,7 @@ urlpatterns = [
     path('list', views.list_users, name='list'),
     path('detail', views.detail, name='detail'),
     path('create', views.create, name='create'),
+    path('import', views.import_users, name='import'),
     path('update/<int:user_id>', views.update, name='update'),
     path('delete/<int:user_id>', views.delete, name='delete'),
     path('updatePassword', views.update_password, name='update_password'),
@@ -1,18 +1,32 @@
 from os import name
-from django.http import JsonResponse
+from django.conf import settings
+from django.db import models
+from django.db.models import Count, Prefetch, Q
+from django.http import JsonResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.contrib.auth.hashers import make_password
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken
-from systems.user.models import User, UserSerializer, UserRole
+from systems.user.models import User, UserSerializer, UserRole, UserSearchGram
 from systems.menu.models import Menu
+from systems.menu.trees import fetch_menu_nodes, build_authorize_tree
 from systems.role.models import Role
+from systems.permission import services as permission_services
+from systems.user import importer
 from common.decorators import auth_required
-from common.responses import success_response, error_response, model_to_dict, paginate_response
-
+from common.tokens import get_token_claims
+from common.principal import get_principal
+from common import search, throttle
+from common.hashing import hash_password, verify_password, password_needs_rehash, HashPoolBusy
+from common.responses import success_response, error_response, model_to_dict, paginate_response, cursor_paginate_response, to_camel_case, format_datetime
+from common.pagination import keyset_page, InvalidPagination
+
+import hashlib
+import itertools
 import json
+import time
 
 @csrf_exempt
 @require_POST
@@ -30,15 +44,34 @@ def login(request):
 
     if not username or not password:
         return error_response('用户名和密码不能为空', 500)
-    
-    # 密码加密
-    password = make_password(password, salt='salt_value', hasher='pbkdf2_sha256')
 
+    # 按IP和用户名限流，在查询用户和计算哈希之前拒绝
+    client_ip = request.META.get('REMOTE_ADDR', '')
+    if not throttle.allow('login_ip', client_ip) or not throttle.allow('login_username', username):
+        return error_response('登录尝试过于频繁，请稍后再试', 429)
+    
+    # 先按唯一索引查询用户，用户不存在时无需计算哈希
     try:
-        user = User.objects.get(username=username, password=password)
+        user = User.objects.get(username=username)
     except User.DoesNotExist:
         return error_response('用户名或密码错误', 500)
 
+    # 校验密码，在独立进程池中计算，池满时直接返回繁忙，避免占满请求线程
+    try:
+        if not verify_password(password, user.password):
+            return error_response('用户名或密码错误', 500)
+    except HashPoolBusy:
+        return error_response('登录请求繁忙，请稍后重试', 503)
+
+    # 旧密码（固定盐或迭代次数与配置不一致）按当前配置重新哈希
+    if password_needs_rehash(user.password):
+        try:
+            user.password = hash_password(password)
+            user.save(update_fields=['password'])
+        except HashPoolBusy:
+            # 繁忙时跳过，下次登录再升级
+            pass
+
     # 生成 JWT token
     refresh = RefreshToken.for_user(user)
     token = refresh.access_token
@@ -46,13 +79,8 @@ def login(request):
     # 序列化用户
     user_dict = UserSerializer(user).data
 
-    # 获取用户关联的所有权限
-    user_permissions = user.permissions.all()
-
-    # 获取角色关联的所有权限
-    permission_list = []
-    for permission in user_permissions:
-        permission_list.append(permission.name)
+    # 获取用户的有效权限（直接关联的权限和角色关联的权限）
+    permission_list = permission_services.get_effective_permissions(user.id)
 
     return success_response({
         'user': user_dict,
@@ -61,6 +89,14 @@ def login(request):
     }, '登录成功')
 
 
+def _permissions_etag(user_id, version, token_str):
+    """
+    刷新权限接口的ETag，由用户ID、权限/用户信息版本号和返回的令牌决定
+    """
+    raw = f'{user_id}:{version}:{token_str}'
+    return quote_etag(hashlib.sha1(raw.encode('utf-8')).hexdigest())
+
+
 @csrf_exempt
 def refresh_permissions(request):
     """
@@ -84,27 +120,44 @@ def refresh_permissions(request):
         # 提取token
         token_str = auth_header.split(' ')[1]
         
-        # 验证token并获取用户信息
+        # 验证token并获取用户ID
+        claims = None
         try:
-            token = AccessToken(token_str)
-            user_id = token['user_id']
-            user = User.objects.get(id=user_id)
+            claims = get_token_claims(token_str)
+            user_id = claims['user_id']
         except InvalidToken:
             # 如果访问令牌无效或过期，尝试从刷新令牌获取用户信息
             try:
                 refresh_token = RefreshToken(token_str)
                 user_id = refresh_token['user_id']
-                user = User.objects.get(id=user_id)
             except Exception:
                 # 刷新令牌也无效
                 return error_response('无效的认证令牌', 401)
         except Exception:
             return error_response('无效的认证令牌', 401)
         
-        # 检查用户状态
-        if user.status != 1:
+        # 检查用户状态（读取认证缓存）
+        if get_principal(user_id).status != 1:
             return error_response('用户账户已被禁用', 403)
-        
+
+        # 原令牌无效，或要求刷新且令牌临近过期时，才重新签发令牌
+        reissue = claims is None or (
+            refresh_cache and claims['exp'] - time.time() < settings.TOKEN_REISSUE_BEFORE.total_seconds()
+        )
+
+        # 权限/用户信息版本号，先于读取数据获取，数据在此之后变化时下次请求会重新获取
+        version = permission_services.get_user_version(user_id)
+
+        # 版本号和令牌都未变化时直接返回304，不查询用户、角色和权限
+        if not reissue:
+            etag = _permissions_etag(user_id, version, token_str)
+            if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                return response
+
+        user = User.objects.get(id=user_id)
+
         # 序列化用户
         user_dict = UserSerializer(user).data
 
@@ -119,40 +172,29 @@ def refresh_permissions(request):
             })
 
         # 获取用户关联的所有权限（包括直接关联和通过角色关联的权限）
-        # 直接关联的权限
-        direct_permissions = user.permissions.all()
+        permission_list = permission_services.get_effective_permissions(user.id)
         
-        permission_list = []
-        for permission in direct_permissions:
-            permission_list.append(permission.name)
-        
-        # 根据refresh_cache参数决定是否生成新的JWT token
         response_data = {
             'user': user_dict,
             'permissions': permission_list,
             'roles': role_list
         }
         
-        if refresh_cache:
+        if reissue:
             # 生成新的 JWT token
             refresh = RefreshToken.for_user(user)
             new_token = refresh.access_token
             response_data['token'] = str(new_token)
             message = '权限和令牌刷新成功'
         else:
-            # 不刷新令牌时长，直接返回权限数据
-            # 如果原始令牌有效，使用它；否则生成新令牌
-            try:
-                AccessToken(token_str)
-                response_data['token'] = token_str
-            except InvalidToken:
-                # 原始令牌无效，生成新令牌
-                refresh = RefreshToken.for_user(user)
-                new_token = refresh.access_token
-                response_data['token'] = str(new_token)
+            # 令牌未临近过期，继续使用原令牌
+            response_data['token'] = token_str
             message = '权限刷新成功'
         
-        return success_response(response_data, message)
+        response = success_response(response_data, message)
+        response['ETag'] = _permissions_etag(user.id, version, response_data['token'])
+        response['Cache-Control'] = 'private, no-cache'
+        return response
         
     except User.DoesNotExist:
         return error_response('用户不存在', 404)
@@ -173,39 +215,48 @@ def page(request):
         # 构建查询条件，只显示未被软删除的用户
         users = User.objects.filter(is_deleted=0)
         
-        # 根据用户名进行过滤
+        # 根据用户名进行过滤，使用 n-gram 索引并按匹配质量排序
         if username:
-            users = users.filter(username__icontains=username)
+            users = search.search(users, 'username', UserSearchGram, 'user', username)
         
-        # 获取总数
-        total = users.count()
-        
-        # 分页处理
-        start_index = (page - 1) * page_size
-        end_index = start_index + page_size
-        paginated_users = users[start_index:end_index]
+        # 一次预取当前页用户未被软删除的角色
+        users = users.prefetch_related(
+            Prefetch('roles', queryset=Role.objects.filter(is_deleted=0).only('id', 'name'), to_attr='active_roles')
+        )
+
+        # 游标分页：按ID从游标之后取一页，不使用OFFSET，总数仅在 withTotal=true 时统计
+        if 'cursor' in request.GET:
+            # 游标按ID排序，会丢弃搜索结果的匹配质量排序，两者不能同时使用
+            if username:
+                return error_response('按用户名搜索时不支持游标分页，请使用 page 参数', 400)
+            total = users.count() if request.GET.get('withTotal') == 'true' else None
+            paginated_users, next_cursor = keyset_page(users, request.GET['cursor'], page_size)
+        else:
+            # 获取总数
+            total = users.count()
+
+            # 分页处理
+            start_index = (page - 1) * page_size
+            end_index = start_index + page_size
+            paginated_users = users[start_index:end_index]
         
         # 构建返回数据
         user_items = []
         for user in paginated_users:
-            # 获取用户关联的角色数量（只统计未被软删除的角色）
-            role_count = user.get_active_roles().count()
-            
-            # 获取用户关联的角色名称列表，优先使用description，不存在则使用name
-            roles = user.get_active_roles()
-            roles_name = []
-            for role in roles:
-                roles_name.append(role.name)
-
             user_dict = model_to_dict(user)
 
             user_dict.pop('password', None)
-            user_dict['roleCount'] = role_count
-            user_dict['rolesName'] = roles_name
+            # 用户关联的角色数量及角色名称列表（只统计未被软删除的角色）
+            user_dict['roleCount'] = len(user.active_roles)
+            user_dict['rolesName'] = [role.name for role in user.active_roles]
             
             user_items.append(user_dict)
         
+        if 'cursor' in request.GET:
+            return cursor_paginate_response(user_items, page_size, next_cursor, total)
         return paginate_response(user_items, page, page_size, total)
+    except InvalidPagination as e:
+        return error_response(str(e), 400)
     except Exception as e:
         return error_response(f'服务器内部错误: {str(e)}')
 
@@ -272,7 +323,7 @@ def create(request):
             return error_response('用户名已存在', 400)
         
         # 密码加密
-        encrypted_password = make_password(password, salt='salt_value', hasher='pbkdf2_sha256')
+        encrypted_password = make_password(password)
         
         # 创建用户
         user = User.objects.create(
@@ -300,6 +351,8 @@ def create(request):
             # 批量创建关联
             if user_roles:
                 UserRole.objects.bulk_create(user_roles)
+                # bulk_create 不触发信号，手动刷新有效权限
+                permission_services.refresh_users([user.id])
 
         # 返回成功响应
         user_data = model_to_dict(user)
@@ -310,6 +363,43 @@ def create(request):
         return error_response(f'服务器内部错误: {str(e)}')
 
 
+# 用户批量导入接口，请求体为 CSV 或 NDJSON；密码在共享的登录哈希进程池中哈希，
+# 只适合小批量，超过 USER_IMPORT_MAX_ROWS 行时拒绝，大批量请使用 manage.py import_users
+@csrf_exempt
+@auth_required('POST')
+def import_users(request):
+    try:
+        # 格式由 format 参数指定，未指定时按 Content-Type 判断
+        fmt = request.GET.get('format') or ('csv' if 'csv' in request.content_type else 'ndjson')
+        if fmt not in ('csv', 'ndjson'):
+            return error_response('format 只能为 csv 或 ndjson', 400)
+
+        # 请求体按行流式读取，不经过 request.body 的大小检查，行数上限也限制不了单行长度，
+        # 读取前按 Content-Length 和 DATA_UPLOAD_MAX_MEMORY_SIZE 拒绝过大的请求体
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length <= 0:
+            return error_response('请求体不能为空，且须提供 Content-Length', 400)
+        max_size = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        if max_size is not None and content_length > max_size:
+            return error_response(f'请求体不能超过{max_size}字节，更多用户请使用 python manage.py import_users 导入', 413)
+
+        # 最多读取上限加一行，超出时不导入任何数据
+        max_rows = settings.USER_IMPORT_MAX_ROWS
+        records = list(itertools.islice(importer.iter_records(request, fmt), max_rows + 1))
+        if len(records) > max_rows:
+            return error_response(f'单次最多导入{max_rows}行，更多用户请使用 python manage.py import_users 导入', 400)
+        
+        result = importer.import_users(records)
+        
+        return success_response(result, '用户导入完成')
+        
+    except Exception as e:
+        return error_response(f'服务器内部错误: {str(e)}')
+
+
 # 用户更新接口
 @csrf_exempt
 @auth_required('PUT')
@@ -348,7 +438,7 @@ def update(request, user_id):
         user.username = username
         if password:
             # 密码加密
-            user.password = make_password(password, salt='salt_value', hasher='pbkdf2_sha256')
+            user.password = make_password(password)
         if email is not None:
             user.email = email
         if phone is not None:
@@ -380,6 +470,8 @@ def update(request, user_id):
                 # 批量创建关联
                 if user_roles:
                     UserRole.objects.bulk_create(user_roles)
+                    # bulk_create 不触发信号，手动刷新有效权限
+                    permission_services.refresh_users([user.id])
 
         # 返回成功响应
         user_data = model_to_dict(user)
@@ -416,19 +508,26 @@ def delete(request, user_id):
 @auth_required('GET')
 def list_users(request):
     try:
-        # 获取所有未被软删除的用户
-        users = User.objects.filter(is_deleted=0)
-        
-        # 构建返回数据
+        # 获取所有未被软删除的用户，角色数量（只统计未被软删除的角色）在同一条分组查询中统计；
+        # 直接读取字段值，不构造模型实例
+        fields = [field.name for field in User._meta.fields if field.name != 'password']
+        users = User.objects.filter(is_deleted=0).annotate(
+            role_count=Count('roles', filter=Q(roles__is_deleted=0))
+        ).values_list(*fields, 'role_count')
+        
+        # 构建返回数据，与 model_to_dict 的格式一致；字段名转换和日期字段判断只做一次
+        keys = [to_camel_case(field) for field in fields] + ['roleCount']
+        date_indexes = [
+            index for index, field in enumerate(fields)
+            if isinstance(User._meta.get_field(field), models.DateTimeField)
+        ]
         user_items = []
-        for user in users:
-            # 获取用户关联的角色数量（只统计未被软删除的角色）
-            role_count = user.get_active_roles().count()
-
-            user_data = model_to_dict(user)
-            user_data['roleCount'] = role_count;
-            user_data.pop('password', None)
-            user_items.append(user_data)
+        for row in users.iterator(chunk_size=2000):
+            if date_indexes:
+                row = [*row]
+                for index in date_indexes:
+                    row[index] = format_datetime(row[index])
+            user_items.append(dict(zip(keys, row)))
         
         return success_response(user_items)
         
@@ -457,21 +556,24 @@ def update_password(request):
         if not all([old_password, new_password, confirm_password]):
             return error_response('缺少必要参数', 400)
         
-        # 密码加密
-        password = make_password(old_password, salt='salt_value', hasher='pbkdf2_sha256')
-
         # 验证旧密码是否正确
         try:
-            user = User.objects.get(username=current_user.username, password=password)
+            user = User.objects.get(id=current_user.id)
         except User.DoesNotExist:
-            return error_response('旧密码不正确', 500)
+            return error_response('用户不存在', 404)
+
+        try:
+            if not verify_password(old_password, user.password):
+                return error_response('旧密码不正确', 500)
+        except HashPoolBusy:
+            return error_response('请求繁忙，请稍后重试', 503)
 
         # 验证新密码与确认密码是否一致
         if new_password != confirm_password:
             return error_response('新密码与确认密码不一致', 400)
         
         # 更新密码
-        new_password = make_password(new_password, salt='salt_value', hasher='pbkdf2_sha256')
+        new_password = make_password(new_password)
         user.password = new_password
         user.save()
         
@@ -493,17 +595,17 @@ def authorize(request):
             return error_response('缺少参数: userId', 400)
             
         # 获取当前用户的角色
-        user_roles = Role.objects.filter(users=request.current_user)
+        user_role_ids = permission_services.get_user_role_ids(request.current_user.id)
         
         # 获取当前角色可以获取到的全部菜单列表
         all_menus = Menu.objects.filter(
-            rolemenu__role__in=user_roles,
+            rolemenu__role_id__in=user_role_ids,
             is_deleted=0
         ).distinct().order_by('order')
 
         
         # 构建完整的菜单树结构
-        tree_data = build_menu_tree_for_user(all_menus)
+        tree_data = build_authorize_tree(fetch_menu_nodes(all_menus))
         
         # 获取指定用户已有的权限菜单
         default_checked_keys = []
@@ -528,58 +630,6 @@ def authorize(request):
     except Exception as e:
         return error_response(f'服务器内部错误: {str(e)}')
 
-def build_menu_tree_for_user(menus):
-    """
-    为角色构建菜单树结构，用于菜单分配
-    """
-    # 创建菜单字典，便于查找
-    menu_dict = {}
-    for menu in menus:
-        menu_data = {
-            'title': menu.label,
-            'value': str(menu.id),
-            'key': str(menu.id),
-            'type': menu.type,
-            'icon': menu.icon,
-        }
-        # 初始化所有节点都有children字段
-        menu_data['children'] = []
-        menu_dict[menu.id] = menu_data
-    
-    # 构建树形结构
-    tree = []
-    for menu in menus:
-        menu_data = menu_dict[menu.id]
-        # 如果有父菜单且父菜单在权限内，则添加到父菜单的children中
-        if menu.parent_id and menu.parent_id in menu_dict:
-            menu_dict[menu.parent_id]['children'].append(menu_data)
-        else:
-            # 否则作为根节点添加
-            tree.append(menu_data)
-    
-    # 移除空的children字段
-    def remove_empty_children(items):
-        for item in items:
-            if 'children' in item and item['children']:
-                remove_empty_children(item['children'])
-            elif 'children' in item and not item['children']:
-                del item['children']
-    
-    remove_empty_children(tree)
-    
-    # 按照菜单顺序排序
-    def sort_children(items):
-        if not items:
-            return
-        items.sort(key=lambda x: int(x['value']))  # 按菜单ID排序
-        for item in items:
-            if 'children' in item and item['children']:
-                sort_children(item['children'])
-    
-    sort_children(tree)
-    
-    return tree
-
 # 保存用户菜单权限接口
 @csrf_exempt
 @auth_required('PUT')
@@ -639,6 +689,8 @@ def save_user_authorization(request):
         
         if user_permissions:
             UserPermission.objects.bulk_create(user_permissions)
+            # bulk_create 不触发信号，手动刷新有效权限
+            permission_services.refresh_users([user.id])
         
         return success_response(None, '用户授权保存成功')
         